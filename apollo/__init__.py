@@ -1,45 +1,137 @@
 import os
+import threading
 
-from cachetools import TTLCache
+from apollo.client import (CircuitBreaker, ConcurrencyLimiter, RateLimiter,
+                           RetryPolicy, SingleFlight, build_session)
 from apollo.util import AssertUser
 from apollo.exceptions import UnknownUserException
 
-from apollo import (annotations, cannedcomments, cannedkeys,
-                    cannedvalues, groups, io, metrics, organisms,
-                    status, users)
 
+class _LazyTTLCache(object):
+    """TTLCache created on first use, so that importing apollo does not
+    import cachetools"""
 
-cache = TTLCache(
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._cache = None
+
+    def _get(self):
+        if self._cache is None:
+            from cachetools import TTLCache
+            self._cache = TTLCache(self.maxsize, self.ttl)
+        return self._cache
+
+    def __contains__(self, key):
+        return key in self._get()
+
+    def __getitem__(self, key):
+        return self._get()[key]
+
+    def __setitem__(self, key, value):
+        self._get()[key] = value
+
+
+cache = _LazyTTLCache(
     100,  # Up to 100 items
     5 * 60  # 5 minute cache life
 )
-userCache = TTLCache(
+userCache = _LazyTTLCache(
     10,  # Up to 2 items
     60  # 1 minute cache life
 )
 
 
-class ApolloInstance(object):
+class _SubClient(object):
+    """
+    Client of an ApolloInstance, imported and created on first access: a
+    command only pays for importing the module of the client it uses.
+    """
 
-    def __init__(self, url, username, password):
+    def __init__(self, module, class_name):
+        self.module = module
+        self.class_name = class_name
+        self.lock = threading.Lock()
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        module = __import__('apollo.' + self.module, None, None, [self.class_name])
+        with self.lock:
+            # Stored on the instance, which takes precedence over this
+            # (non-data) descriptor from then on
+            if self.module not in instance.__dict__:
+                instance.__dict__[self.module] = getattr(module, self.class_name)(instance)
+            return instance.__dict__[self.module]
+
+
+class ApolloInstance(object):
+    # One client per Apollo module, all sharing the instance's session,
+    # created on first access
+    annotations = _SubClient('annotations', 'AnnotationsClient')
+    cannedcomments = _SubClient('cannedcomments', 'CannedCommentsClient')
+    cannedkeys = _SubClient('cannedkeys', 'CannedKeysClient')
+    cannedvalues = _SubClient('cannedvalues', 'CannedValuesClient')
+    groups = _SubClient('groups', 'GroupsClient')
+    io = _SubClient('io', 'IOClient')
+    metrics = _SubClient('metrics', 'MetricsClient')
+    organisms = _SubClient('organisms', 'OrganismsClient')
+    status = _SubClient('status', 'StatusClient')
+    users = _SubClient('users', 'UsersClient')
+
+    def __init__(self, url, username, password, pool_connections=10,
+                 pool_maxsize=10, pool_block=False, keep_alive=True,
+                 retry=None, rate_limit=None, concurrency_limit=None,
+                 circuit_breaker=None, cache=None):
         self.apollo_url = url
         self.username = username
         self.password = password
 
-        self.annotations = annotations.AnnotationsClient(self)
-        self.cannedcomments = cannedcomments.CannedCommentsClient(self)
-        self.cannedkeys = cannedkeys.CannedKeysClient(self)
-        self.cannedvalues = cannedvalues.CannedValuesClient(self)
-        self.groups = groups.GroupsClient(self)
-        self.io = io.IOClient(self)
-        self.metrics = metrics.MetricsClient(self)
-        self.organisms = organisms.OrganismsClient(self)
-        self.status = status.StatusClient(self)
-        self.users = users.UsersClient(self)
+        # Transient failures are retried by every client, see RetryPolicy
+        self.retry = RetryPolicy() if retry is None else retry
+        # Optional limits, shared by every client so that concurrent bulk
+        # jobs back off together: a rate in requests per second (or a
+        # RateLimiter), and True (or a ConcurrencyLimiter) for adaptive
+        # concurrency.
+        if rate_limit is not None and not isinstance(rate_limit, RateLimiter):
+            rate_limit = RateLimiter(rate_limit)
+        self.rate_limiter = rate_limit
+        if concurrency_limit is True:
+            concurrency_limit = ConcurrencyLimiter(maximum=pool_maxsize)
+        self.concurrency_limiter = concurrency_limit or None
+        # Optional, True (or a CircuitBreaker) to fail fast while the server
+        # is down
+        if circuit_breaker is True:
+            circuit_breaker = CircuitBreaker()
+        self.circuit_breaker = circuit_breaker or None
+        # Identical concurrent reads share a single request
+        self.single_flight = SingleFlight()
+        # Optional, True (or a ResponseCache) to cache the responses of
+        # read endpoints, see apollo.response_cache
+        if cache is True:
+            from apollo.response_cache import ResponseCache
+            cache = ResponseCache()
+        self.response_cache = cache or None
+
+        # One connection pool, shared by all of the clients
+        self.session = build_session(pool_connections=pool_connections,
+                                     pool_maxsize=pool_maxsize,
+                                     pool_block=pool_block,
+                                     keep_alive=keep_alive)
 
     def __str__(self):
         return '<ApolloInstance at %s>' % self.apollo_url
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close every pooled connection to the Apollo server"""
+        self.session.close()
+
 
 def require_user(wa, email):
     """Require that the user has an account"""
@@ -0,0 +1,449 @@
+"""
+Asyncio flavoured Apollo clients, built on top of aiohttp.
+
+Every request method returns a coroutine, and all of the clients of an
+:class:`AsyncApolloInstance` share a single aiohttp connection pool and a
+bounded number of in-flight requests::
+
+    async with AsyncApolloInstance(url, username, password) as wa:
+        features = await wa.annotations.get_features(organism, sequence)
+
+Requires Python 3.6 or later and the optional ``aiohttp`` dependency
+(``pip install apollo[async]``). The rest of the library still supports
+the older Python versions, which must not import this module.
+"""
+import asyncio
+import json
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from apollo.annotations import AnnotationsMixin, _batch_error
+from apollo.client import Client
+from apollo.exceptions import UnexpectedResponseException
+from apollo.groups import GroupsClient, _fix_group
+from apollo.intervals import FeatureIndex
+from apollo.io import IOMixin
+from apollo.organisms import OrganismsClient
+from apollo.users import UsersClient, _fix_user
+
+
+class AsyncClient(Client):
+    """
+    Base client class implementing coroutines to make requests to the server
+    """
+
+    async def post(self, client_method, data, post_params=None, is_json=True):
+        """Make a POST request"""
+        url = self._wa.apollo_url + self.CLIENT_BASE + client_method
+
+        if post_params is None:
+            post_params = {}
+
+        headers = {
+            'Content-Type': 'application/json'
+        }
+
+        data.update({
+            'username': self._wa.username,
+            'password': self._wa.password,
+        })
+
+        async with self._wa._semaphore():
+            session = self._wa._get_session()
+            async with session.post(url, data=json.dumps(data),
+                                    headers=headers, params=post_params,
+                                    allow_redirects=False) as resp:
+                if resp.status == 200 or resp.status == 302:
+                    if is_json:
+                        data = await resp.json(content_type=None)
+                        return self._scrub_data(data)
+                    else:
+                        return await resp.text()
+
+                raise UnexpectedResponseException(resp.status, await resp.text())
+
+    async def get(self, client_method, get_params):
+        """Make a GET request"""
+        url = self._wa.apollo_url + self.CLIENT_BASE + client_method
+
+        async with self._wa._semaphore():
+            session = self._wa._get_session()
+            async with session.get(url, params=get_params) as response:
+                if response.status == 200:
+                    data = await response.json(content_type=None)
+                    return self._scrub_data(data)
+
+                raise UnexpectedResponseException(response.status, await response.text())
+
+
+class AsyncAnnotationsClient(AnnotationsMixin, AsyncClient):
+
+    async def _post_indexed(self, client_method, data):
+        response = await self.post(client_method, data)
+        self._update_indexes(client_method, data, response)
+        return response
+
+    async def _post_batched(self, client_method, features, organism=None,
+                            sequence=None, batch_size=None):
+        batches = list(self._batches(features, organism, sequence, batch_size))
+        results = []
+        for i, data in enumerate(batches):
+            try:
+                response = await self._post_indexed(client_method, data)
+            except Exception as e:
+                raise _batch_error(batches, i, e, results)
+            results.extend(response.get('features', []))
+        return {'features': results}
+
+    async def get_organism_features(self, organism, sequences=None, workers=4, progress=None):
+        """
+        Get the features of every sequence of an organism, see
+        :meth:`apollo.annotations.AnnotationsClient.get_organism_features`::
+
+            async for sequence, features in wa.annotations.get_organism_features('Yeast'):
+                ...
+        """
+        if sequences is None:
+            sequences = await self._wa.organisms._sequence_names(organism)
+        sequences = list(sequences)
+        total = len(sequences)
+
+        async def fetch(sequence):
+            data = self._update_data({}, organism, sequence)
+            return sequence, await self.post('getFeatures', data)
+
+        pending = set()
+        remaining = iter(sequences)
+        try:
+            for sequence in remaining:
+                pending.add(asyncio.ensure_future(fetch(sequence)))
+                if len(pending) >= workers * 2:
+                    break
+
+            done_count = 0
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    sequence, result = future.result()
+                    done_count += 1
+                    if progress is not None:
+                        progress(done_count, total, sequence)
+
+                    for next_sequence in remaining:
+                        pending.add(asyncio.ensure_future(fetch(next_sequence)))
+                        break
+
+                    yield sequence, result
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def build_index(self, organism=None, sequence=None, workers=4):
+        """
+        Fetch features and build an interval index over them, see
+        :meth:`apollo.annotations.AnnotationsClient.build_index`
+        """
+        index = FeatureIndex()
+        if organism and not sequence:
+            async for name, features in self.get_organism_features(organism, workers=workers):
+                index.add_features(features, sequence=name)
+        else:
+            data = self._update_data({}, organism, sequence)
+            index.add_features(await self.post('getFeatures', data), sequence=data['sequence'])
+
+        self._track_index(index)
+        return index
+
+
+class AsyncIOClient(IOMixin, AsyncClient):
+    pass
+
+
+class AsyncOrganismsClient(AsyncClient, OrganismsClient):
+
+    async def _sequence_names(self, organism):
+        response = await self.get_sequences(organism)
+        if isinstance(response, dict):
+            response = response.get('sequences', [])
+        return [x['name'] for x in response]
+
+    async def add_organism(self, common_name, directory, blatdb=None,
+                           genus=None, species=None, public=False):
+        """
+        Add an organism, see :meth:`apollo.organisms.OrganismsClient.add_organism`
+        """
+        data = {
+            'commonName': common_name,
+            'directory': directory,
+            'publicMode': public,
+        }
+
+        if blatdb is not None:
+            data['blatdb'] = blatdb
+        if genus is not None:
+            data['genus'] = genus
+        if species is not None:
+            data['species'] = species
+
+        response = await self.post('addOrganism', data)
+        return [x for x in response if x['commonName'] == common_name][0]
+
+    async def update_organism(self, organism_id, common_name, directory,
+                              blatdb=None, species=None, genus=None,
+                              public=False):
+        """
+        Update an organism, see :meth:`apollo.organisms.OrganismsClient.update_organism`
+        """
+        data = {
+            'id': organism_id,
+            'name': common_name,
+            'directory': directory,
+            'publicMode': public,
+        }
+
+        if blatdb is not None:
+            data['blatdb'] = blatdb
+        if genus is not None:
+            data['genus'] = genus
+        if species is not None:
+            data['species'] = species
+
+        response = await self.post('updateOrganismInfo', data)
+        if len(response.keys()) == 0:
+            return await self.show_organism(organism_id)
+        return response
+
+
+class AsyncUsersClient(AsyncClient, UsersClient):
+
+    async def _handle_empty(self, user, response):
+        if len(response.keys()) == 0:
+            return await self.show_user(user)
+        return response
+
+    async def get_users(self):
+        """
+        Get all users, see :meth:`apollo.users.UsersClient.get_users`
+        """
+        res = await self.post('loadUsers', {})
+        return [_fix_user(user) for user in res]
+
+    async def show_user(self, user):
+        """
+        Get a specific user, see :meth:`apollo.users.UsersClient.show_user`
+        """
+        res = await self.post('loadUsers', {'userId': user})
+        if isinstance(res, list):
+            res = res[0]
+        return _fix_user(res)
+
+    async def get_organism_permissions(self, user):
+        """
+        Display a user's organism permissions, see
+        :meth:`apollo.users.UsersClient.get_organism_permissions`
+        """
+        return (await self.show_user(user))['organismPermissions']
+
+    async def update_organism_permissions(self, user, organism,
+                                          administrate=False, write=False,
+                                          export=False, read=False):
+        """
+        Update the permissions of a user on a specified organism, see
+        :meth:`apollo.users.UsersClient.update_organism_permissions`
+        """
+        data = {
+            'userId': user,
+            'organism': organism,
+            'ADMINISTRATE': administrate,
+            'WRITE': write,
+            'EXPORT': export,
+            'READ': read,
+        }
+        response = await self.post('updateOrganismPermission', data)
+        response['permissions'] = json.loads(response['permissions'])
+        return response
+
+    async def create_user(self, email, first_name, last_name, password,
+                          role="user", metadata={}):
+        """
+        Create a new user, see :meth:`apollo.users.UsersClient.create_user`
+        """
+        data = {
+            'firstName': first_name,
+            'lastName': last_name,
+            'email': email,
+            'metadata': metadata,
+            'role': role.upper() if role else role,
+            'newPassword': password,
+        }
+        response = await self.post('createUser', data)
+        return await self._handle_empty(email, response)
+
+    async def update_user(self, email, first_name, last_name, password,
+                          metadata={}):
+        """
+        Update an existing user, see :meth:`apollo.users.UsersClient.update_user`
+        """
+        data = {
+            'email': email,
+            'firstName': first_name,
+            'lastName': last_name,
+            'newPassword': password,
+            'metadata': metadata,
+        }
+        response = await self.post('updateUser', data)
+        return await self._handle_empty(email, response)
+
+
+class AsyncGroupsClient(AsyncClient, GroupsClient):
+
+    async def show_group(self, group_id):
+        """
+        Get information about a group, see :meth:`apollo.groups.GroupsClient.show_group`
+        """
+        res = await self.post('loadGroups', {'groupId': group_id})
+        if isinstance(res, list):
+            return _fix_group(res[0])
+        else:
+            return _fix_group(res)
+
+    async def get_groups(self):
+        """
+        Get all the groups, see :meth:`apollo.groups.GroupsClient.get_groups`
+        """
+        res = await self.post('loadGroups', {})
+        return [_fix_group(group) for group in res]
+
+    async def update_group(self, group_id, new_name):
+        """
+        Update the name of a group, see :meth:`apollo.groups.GroupsClient.update_group`
+        """
+        data = {
+            'id': group_id,
+            'name': new_name,
+        }
+        try:
+            await self.post('updateGroup', data)
+        except Exception:
+            pass
+
+        # Apollo returns a 404 here despite actually renaming the group.
+        response = (await self.post('loadGroups', {'groupId': group_id}))[0]
+        return _fix_group(response)
+
+    async def get_organism_permissions(self, group):
+        """
+        Get the group's organism permissions, see
+        :meth:`apollo.groups.GroupsClient.get_organism_permissions`
+        """
+        data = {
+            'name': group,
+        }
+        return _fix_group(await self.post('getOrganismPermissionsForGroup', data))
+
+    async def update_organism_permissions(self, group, organism_name,
+                                          administrate=False, write=False,
+                                          read=False, export=False):
+        """
+        Update the group's permissions on an organism, see
+        :meth:`apollo.groups.GroupsClient.update_organism_permissions`
+        """
+        data = {
+            'name': group,
+            'organism': organism_name,
+            'ADMINISTRATE': administrate,
+            'WRITE': write,
+            'EXPORT': export,
+            'READ': read,
+        }
+        response = await self.post('updateOrganismPermission', data)
+        response['permissions'] = json.loads(response['permissions'])
+        return response
+
+    async def update_membership(self, group_id, users=[]):
+        """
+        Update the group's membership, see
+        :meth:`apollo.groups.GroupsClient.update_membership`
+        """
+        data = {
+            'groupId': group_id,
+            'users': users,
+        }
+        return _fix_group(await self.post('updateMembership', data))
+
+
+class AsyncApolloInstance(object):
+    """
+    Asyncio counterpart of :class:`apollo.ApolloInstance`
+
+    :type max_concurrency: int
+    :param max_concurrency: Maximum number of requests in flight at once,
+      across all of the clients
+
+    :type pool_maxsize: int
+    :param pool_maxsize: Maximum number of pooled connections (0 for no limit)
+
+    :type pool_maxsize_per_host: int
+    :param pool_maxsize_per_host: Maximum number of pooled connections to a
+      single host (0 for no limit)
+
+    :type verify: bool
+    :param verify: Verify the server's TLS certificate
+    """
+
+    def __init__(self, url, username, password, max_concurrency=10,
+                 pool_maxsize=100, pool_maxsize_per_host=0, verify=True):
+        if aiohttp is None:
+            raise ImportError("AsyncApolloInstance requires the aiohttp package")
+
+        self.apollo_url = url
+        self.username = username
+        self.password = password
+
+        self.max_concurrency = max_concurrency
+        self._pool_maxsize = pool_maxsize
+        self._pool_maxsize_per_host = pool_maxsize_per_host
+        self._verify = verify
+        # Both are bound to the running event loop, so they are created on
+        # first use rather than here.
+        self._session = None
+        self._limit = None
+
+        self.annotations = AsyncAnnotationsClient(self)
+        self.groups = AsyncGroupsClient(self)
+        self.io = AsyncIOClient(self)
+        self.organisms = AsyncOrganismsClient(self)
+        self.users = AsyncUsersClient(self)
+
+    def __str__(self):
+        return '<AsyncApolloInstance at %s>' % self.apollo_url
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._pool_maxsize,
+                limit_per_host=self._pool_maxsize_per_host,
+                ssl=None if self._verify else False,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def _semaphore(self):
+        if self._limit is None:
+            self._limit = asyncio.Semaphore(self.max_concurrency)
+        return self._limit
+
+    async def close(self):
+        """Close every pooled connection to the Apollo server"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
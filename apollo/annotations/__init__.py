@@ -1,15 +1,155 @@
 """
 Contains possible interactions with the Apollo's Annotations
 """
-from apollo.client import Client
+import threading
+import time
+import weakref
+from collections import OrderedDict
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
-class AnnotationsClient(Client):
+from apollo.client import Client
+from apollo.exceptions import BatchException
+from apollo.intervals import FeatureIndex
+
+
+def _pairs(values):
+    """Accept either a dictionary or an iterable of tuples"""
+    if isinstance(values, dict):
+        return list(values.items())
+    return list(values)
+
+
+def _batch_error(batches, index, error, results):
+    """BatchException for the failure of the request of ``batches[index]``"""
+    return BatchException(
+        error,
+        applied=[f for data in batches[:index] for f in data['features']],
+        failed=list(batches[index]['features']),
+        unsent=[f for data in batches[index + 1:] for f in data['features']],
+        results=results,
+    )
+
+
+def _gff3_ids(line):
+    """ID and parents of a GFF3 feature line, or None for other lines"""
+    fields = line.rstrip('\r\n').split('\t')
+    if line.startswith('#') or len(fields) < 9:
+        return None
+    attributes = dict(x.strip().split('=', 1) for x in fields[8].split(';') if '=' in x)
+    ids = [attributes['ID']] if 'ID' in attributes else []
+    return ids + (attributes['Parent'].split(',') if 'Parent' in attributes else [])
+
+
+def _gff3_chunks(handle, target_lines):
+    """
+    Split the lines of a GFF3 file into chunks of about ``target_lines``
+    feature lines which can be parsed on their own. A first pass finds the last
+    line of every feature hierarchy (features linked by ID and Parent,
+    wherever they are in the file), and a chunk only ends where no
+    hierarchy continues past. The FASTA section, if any, is skipped.
+
+    :type handle: file
+    :param handle: GFF3 file, which must support seeking back to its
+      current position
+    """
+    # Union-find of the IDs of linked features, and the last line of the
+    # hierarchy of each root
+    roots = {}
+    last = {}
+
+    def find(x):
+        roots.setdefault(x, x)
+        while roots[x] != x:
+            roots[x] = roots[roots[x]]
+            x = roots[x]
+        return x
+
+    def lines():
+        for i, line in enumerate(handle):
+            if line.startswith('##FASTA') or line.startswith('>'):
+                break
+            yield i, line
+
+    start = handle.tell()
+    for i, line in lines():
+        linked = _gff3_ids(line)
+        if not linked:
+            continue
+        root = find(linked[0])
+        for other in linked[1:]:
+            other = find(other)
+            if other != root:
+                roots[other] = root
+                last.pop(other, None)
+        last[root] = i
+
+    handle.seek(start)
+    chunk = []
+    features = 0
+    # Last line of the hierarchies of the features in the chunk
+    reach = -1
+    for i, line in lines():
+        linked = _gff3_ids(line)
+        if linked is not None:
+            if features >= target_lines and reach < i:
+                yield ''.join(chunk)
+                chunk = []
+                features = 0
+            features += 1
+            if linked:
+                reach = max(reach, last[find(linked[0])])
+        chunk.append(line)
+
+    if chunk:
+        yield ''.join(chunk)
+
+
+class AnnotationsMixin(object):
+    """
+    Requests of the Apollo Annotations module, shared by
+    :class:`AnnotationsClient` and :class:`apollo.aio.AsyncAnnotationsClient`
+    """
     CLIENT_BASE = '/annotationEditor/'
+    READ_METHODS = frozenset([
+        'getComments',
+        'getFeatures',
+        'getSequence',
+        'getSequenceAlterations',
+    ])
+    IDEMPOTENT_METHODS = READ_METHODS | frozenset([
+        'setBoundaries',
+        'setDescription',
+        'setLongestOrf',
+        'setName',
+        'setReadthroughStopCodon',
+        'setStatus',
+        'setSymbol',
+        'setTranslationEnd',
+        'setTranslationStart',
+    ])
+    # Maximum number of features sent in a single request by batch methods
+    BATCH_SIZE = 100
+
+    def __init__(self, webapolloinstance, **requestArgs):
+        super(AnnotationsMixin, self).__init__(webapolloinstance, **requestArgs)
+        # Feature indexes kept up to date with the edits made by this client,
+        # shared with the clients made by with_sequence
+        self._indexes = weakref.WeakSet()
+        self._indexes_lock = threading.Lock()
 
     def _update_data(self, data, organism=None, sequence=None):
         if sequence and organism:
-            self.set_sequence(organism, sequence)
+            # Only scoped to this request, so that a client can be shared by
+            # threads working on different sequences.
+            data.update({
+                'sequence': sequence,
+                'organism': organism,
+            })
+            return data
 
         if not hasattr(self, '_extra_data'):
             raise Exception("Please call setSequence first")
@@ -17,6 +157,38 @@ class AnnotationsClient(Client):
         data.update(self._extra_data)
         return data
 
+    def _track_index(self, index):
+        with self._indexes_lock:
+            self._indexes.add(index)
+
+    def _update_indexes(self, client_method, data, response):
+        with self._indexes_lock:
+            indexes = list(self._indexes)
+        for index in indexes:
+            if client_method == 'addFeature':
+                index.add_features(response, sequence=data.get('sequence'))
+            elif client_method == 'setBoundaries':
+                for feature in data['features']:
+                    index.set_location(feature['uniquename'],
+                                       feature['location'].get('fmin'),
+                                       feature['location'].get('fmax'))
+            elif client_method == 'deleteFeature':
+                for feature in data['features']:
+                    index.remove(feature['uniquename'])
+
+    def _batches(self, features, organism=None, sequence=None, batch_size=None):
+        """Request data for each chunk of ``batch_size`` features"""
+        if batch_size is None:
+            batch_size = self.BATCH_SIZE
+        if batch_size < 1:
+            raise Exception("batch_size must be a positive integer")
+
+        for i in range(0, len(features), batch_size):
+            data = {
+                'features': features[i:i + batch_size],
+            }
+            yield self._update_data(data, organism, sequence)
+
     def set_sequence(self, organism, sequence):
         """
         Set the sequence for subsequent requests. Mostly used in client scripts
@@ -36,6 +208,31 @@ class AnnotationsClient(Client):
             'organism': organism,
         }
 
+    def with_sequence(self, organism, sequence):
+        """
+        Get a client bound to an organism and sequence, leaving this client
+        untouched. The new client shares the connection pool of this one, so
+        it is cheap to create one per worker thread::
+
+            chr1 = wa.annotations.with_sequence('Yeast', 'chrI')
+            chr1.set_name(feature_id, 'name')
+
+        :type organism: str
+        :param organism: Organism Name
+
+        :type sequence: str
+        :param sequence: Sequence Name
+
+        :rtype: AnnotationsClient
+        :return: an annotations client for this organism and sequence
+        """
+        # Client.__init__ takes verify out of the request arguments
+        client = self.__class__(self._wa, verify=self._verify, **self._request_args)
+        client.set_sequence(organism, sequence)
+        client._indexes = self._indexes
+        client._indexes_lock = self._indexes_lock
+        return client
+
     def set_description(self, feature_id, description, organism=None, sequence=None):
         """
         Set a feature's description
@@ -63,7 +260,7 @@ class AnnotationsClient(Client):
                 }
             ]
         }
-        data = self._update_data(data, sequence, organism)
+        data = self._update_data(data, organism, sequence)
         return self.post('setDescription', data)
 
     def set_name(self, feature_id, name, organism=None, sequence=None):
@@ -157,6 +354,122 @@ class AnnotationsClient(Client):
         data = self._update_data(data, organism, sequence)
         return self.post('setSymbol', data)
 
+    def set_descriptions(self, descriptions, organism=None, sequence=None, batch_size=None):
+        """
+        Set the description of many features, using as few requests as possible
+
+        :type descriptions: dict
+        :param descriptions: Feature UUID to description mapping (or a list of
+          (feature UUID, description) tuples)
+
+        :type organism: str
+        :param organism: Organism Common Name
+
+        :type sequence: str
+        :param sequence: Sequence Name
+
+        :type batch_size: int
+        :param batch_size: Maximum number of features per request (default: BATCH_SIZE)
+
+        :rtype: dict
+        :return: A standard apollo feature dictionary ({"features": [{...}]})
+          containing the results of every batch. If a request fails, a
+          :class:`apollo.exceptions.BatchException` tells which features
+          were applied.
+        """
+        features = [
+            {'uniquename': feature_id, 'description': description}
+            for (feature_id, description) in _pairs(descriptions)
+        ]
+        return self._post_batched('setDescription', features, organism, sequence, batch_size)
+
+    def set_names(self, names, organism=None, sequence=None, batch_size=None):
+        """
+        Set the name of many features, using as few requests as possible
+
+        :type names: dict
+        :param names: Feature UUID to name mapping (or a list of
+          (feature UUID, name) tuples)
+
+        :type organism: str
+        :param organism: Organism Common Name
+
+        :type sequence: str
+        :param sequence: Sequence Name
+
+        :type batch_size: int
+        :param batch_size: Maximum number of features per request (default: BATCH_SIZE)
+
+        :rtype: dict
+        :return: A standard apollo feature dictionary ({"features": [{...}]})
+          containing the results of every batch. If a request fails, a
+          :class:`apollo.exceptions.BatchException` tells which features
+          were applied.
+        """
+        features = [
+            {'uniquename': feature_id, 'name': name}
+            for (feature_id, name) in _pairs(names)
+        ]
+        return self._post_batched('setName', features, organism, sequence, batch_size)
+
+    def set_statuses(self, statuses, organism=None, sequence=None, batch_size=None):
+        """
+        Set the status of many features, using as few requests as possible
+
+        :type statuses: dict
+        :param statuses: Feature UUID to status mapping (or a list of
+          (feature UUID, status) tuples)
+
+        :type organism: str
+        :param organism: Organism Common Name
+
+        :type sequence: str
+        :param sequence: Sequence Name
+
+        :type batch_size: int
+        :param batch_size: Maximum number of features per request (default: BATCH_SIZE)
+
+        :rtype: dict
+        :return: A standard apollo feature dictionary ({"features": [{...}]})
+          containing the results of every batch. If a request fails, a
+          :class:`apollo.exceptions.BatchException` tells which features
+          were applied.
+        """
+        features = [
+            {'uniquename': feature_id, 'status': status}
+            for (feature_id, status) in _pairs(statuses)
+        ]
+        return self._post_batched('setStatus', features, organism, sequence, batch_size)
+
+    def set_symbols(self, symbols, organism=None, sequence=None, batch_size=None):
+        """
+        Set the symbol of many features, using as few requests as possible
+
+        :type symbols: dict
+        :param symbols: Feature UUID to symbol mapping (or a list of
+          (feature UUID, symbol) tuples)
+
+        :type organism: str
+        :param organism: Organism Common Name
+
+        :type sequence: str
+        :param sequence: Sequence Name
+
+        :type batch_size: int
+        :param batch_size: Maximum number of features per request (default: BATCH_SIZE)
+
+        :rtype: dict
+        :return: A standard apollo feature dictionary ({"features": [{...}]})
+          containing the results of every batch. If a request fails, a
+          :class:`apollo.exceptions.BatchException` tells which features
+          were applied.
+        """
+        features = [
+            {'uniquename': feature_id, 'symbol': symbol}
+            for (feature_id, symbol) in _pairs(symbols)
+        ]
+        return self._post_batched('setSymbol', features, organism, sequence, batch_size)
+
     def get_comments(self, feature_id, organism=None, sequence=None):
         """
         Get a feature's comments
@@ -253,6 +566,42 @@ class AnnotationsClient(Client):
         data = self._update_data(data, organism, sequence)
         return self.post('addAttribute', data)
 
+    def add_attributes(self, attributes, organism=None, sequence=None, batch_size=None):
+        """
+        Add attributes to many features, using as few requests as possible
+
+        :type attributes: list
+        :param attributes: List of (feature UUID, attribute key, attribute value) tuples
+
+        :type organism: str
+        :param organism: Organism Common Name
+
+        :type sequence: str
+        :param sequence: Sequence Name
+
+        :type batch_size: int
+        :param batch_size: Maximum number of features per request (default: BATCH_SIZE)
+
+        :rtype: dict
+        :return: A standard apollo feature dictionary ({"features": [{...}]})
+          containing the results of every batch. If a request fails, a
+          :class:`apollo.exceptions.BatchException` tells which features
+          were applied.
+        """
+        features = [
+            {
+                'uniquename': feature_id,
+                'non_reserved_properties': [
+                    {
+                        'tag': attribute_key,
+                        'value': attribute_value,
+                    }
+                ]
+            }
+            for (feature_id, attribute_key, attribute_value) in attributes
+        ]
+        return self._post_batched('addAttribute', features, organism, sequence, batch_size)
+
     def delete_attribute(self, feature_id, attribute_key, attribute_value, organism=None, sequence=None):
         """
         Delete an attribute from a feature
@@ -405,7 +754,7 @@ class AnnotationsClient(Client):
             'features': feature,
         }
         data = self._update_data(data, organism, sequence)
-        return self.post('addFeature', data)
+        return self._post_indexed('addFeature', data)
 
     def add_transcript(self, transcript={}, suppress_history=False, suppress_events=False, organism=None, sequence=None):
         """
@@ -586,7 +935,7 @@ class AnnotationsClient(Client):
             }]
         }
         data = self._update_data(data, organism, sequence)
-        return self.post('setBoundaries', data)
+        return self._post_indexed('setBoundaries', data)
 
     def set_readthrough_stop_codon(self, feature_id, organism=None, sequence=None):
         """
@@ -731,7 +1080,32 @@ class AnnotationsClient(Client):
             ]
         }
         data = self._update_data(data, organism, sequence)
-        return self.post('deleteFeature', data)
+        return self._post_indexed('deleteFeature', data)
+
+    def delete_features(self, feature_ids, organism=None, sequence=None, batch_size=None):
+        """
+        Delete many features, using as few requests as possible
+
+        :type feature_ids: list
+        :param feature_ids: Feature UUIDs
+
+        :type organism: str
+        :param organism: Organism Common Name
+
+        :type sequence: str
+        :param sequence: Sequence Name
+
+        :type batch_size: int
+        :param batch_size: Maximum number of features per request (default: BATCH_SIZE)
+
+        :rtype: dict
+        :return: A standard apollo feature dictionary ({"features": [{...}]})
+          containing the results of every batch. If a request fails, a
+          :class:`apollo.exceptions.BatchException` tells which features
+          were applied.
+        """
+        features = [{'uniquename': feature_id} for feature_id in feature_ids]
+        return self._post_batched('deleteFeature', features, organism, sequence, batch_size)
 
     def get_search_tools(self):
         """
@@ -785,3 +1159,529 @@ class AnnotationsClient(Client):
         }
         data = self._update_data(data, organism, sequence)
         return self.post('getGff3', data, is_json=False)
+
+
+class AnnotationsClient(AnnotationsMixin, Client):
+    # Number of GFF3 lines load_gff3 parses at once
+    GFF3_CHUNK_LINES = 10000
+
+    def _post_indexed(self, client_method, data):
+        """POST a request, and apply its effect to the attached indexes"""
+        response = self.post(client_method, data)
+        self._update_indexes(client_method, data, response)
+        return response
+
+    def _post_batched(self, client_method, features, organism=None,
+                      sequence=None, batch_size=None):
+        """POST ``features`` in chunks of ``batch_size``, merging the
+        features of every response. A failing request raises a
+        BatchException telling which features were applied."""
+        batches = list(self._batches(features, organism, sequence, batch_size))
+        results = []
+        for i, data in enumerate(batches):
+            try:
+                response = self._post_indexed(client_method, data)
+            except Exception as e:
+                raise _batch_error(batches, i, e, results)
+            results.extend(response.get('features', []))
+        return {'features': results}
+
+    def buffered(self, organism=None, sequence=None, max_edits=1000,
+                 max_age=None, batch_size=None):
+        """
+        Start a buffered editing session: edits are queued, coalesced per
+        feature and sent in batches. Use as a context manager to flush any
+        remaining edits on exit::
+
+            with wa.annotations.buffered('Yeast', 'chrI') as edits:
+                edits.set_status(feature_id, 'Finished')
+
+        :type organism: str
+        :param organism: Organism Common Name
+
+        :type sequence: str
+        :param sequence: Sequence Name
+
+        :type max_edits: int
+        :param max_edits: Flush once this many edits are pending
+
+        :type max_age: float
+        :param max_age: Flush once the oldest pending edit is older than this
+          many seconds, from a background timer
+
+        :type batch_size: int
+        :param batch_size: Maximum number of features per request (default: BATCH_SIZE)
+
+        :rtype: AnnotationEditBuffer
+        :return: the edit buffer
+        """
+        return AnnotationEditBuffer(self, organism=organism, sequence=sequence,
+                                    max_edits=max_edits, max_age=max_age,
+                                    batch_size=batch_size)
+
+    def get_organism_features(self, organism, sequences=None, workers=4, progress=None):
+        """
+        Get the features of every sequence of an organism, fetching several
+        sequences concurrently. Results are yielded as soon as each sequence
+        completes, so not necessarily in the order of ``sequences``::
+
+            for sequence, features in wa.annotations.get_organism_features('Yeast'):
+                ...
+
+        :type organism: str
+        :param organism: Organism Common Name
+
+        :type sequences: list
+        :param sequences: Names of the sequences to fetch (default is all)
+
+        :type workers: int
+        :param workers: Number of concurrent requests
+
+        :type progress: callable
+        :param progress: Called as ``progress(done, total, sequence)`` after
+          each sequence completes
+
+        :rtype: generator
+        :return: (sequence name, standard apollo feature dictionary) tuples
+        """
+        if sequences is None:
+            sequences = self._wa.organisms._sequence_names(organism)
+        sequences = list(sequences)
+        total = len(sequences)
+
+        def fetch(sequence):
+            data = self._update_data({}, organism, sequence)
+            return self.post('getFeatures', data)
+
+        # Only imported by the methods using threads, to keep importing
+        # the module (and so starting arrow) fast
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+        pending = {}
+        remaining = iter(sequences)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            # Keep a bounded window of requests in flight, so that results
+            # are not accumulated faster than they are consumed.
+            for sequence in remaining:
+                pending[executor.submit(fetch, sequence)] = sequence
+                if len(pending) >= workers * 2:
+                    break
+
+            done_count = 0
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    sequence = pending.pop(future)
+                    result = future.result()
+                    done_count += 1
+                    if progress is not None:
+                        progress(done_count, total, sequence)
+
+                    for next_sequence in remaining:
+                        pending[executor.submit(fetch, next_sequence)] = next_sequence
+                        break
+
+                    yield sequence, result
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def build_index(self, organism=None, sequence=None, workers=4):
+        """
+        Fetch features and build an interval index over them, which is kept
+        up to date as this client adds, resizes (``set_boundaries``) or
+        deletes features::
+
+            index = wa.annotations.build_index('Yeast', 'chrI')
+            index.overlapping('chrI', 1000, 5000)
+
+        :type organism: str
+        :param organism: Organism Common Name
+
+        :type sequence: str
+        :param sequence: Sequence Name. If only the organism is provided, all
+          of its sequences are indexed.
+
+        :type workers: int
+        :param workers: Number of concurrent requests when indexing a whole organism
+
+        :rtype: FeatureIndex
+        :return: the feature index
+        """
+        index = FeatureIndex()
+        if organism and not sequence:
+            for name, features in self.get_organism_features(organism, workers=workers):
+                index.add_features(features, sequence=name)
+        else:
+            data = self._update_data({}, organism, sequence)
+            index.add_features(self.post('getFeatures', data), sequence=data['sequence'])
+
+        self._track_index(index)
+        return index
+
+    def load_gff3(self, organism, gff3, batch_size=None, workers=4, progress=None):
+        """
+        Load the features of a GFF3 file. The file is parsed in chunks of
+        about GFF3_CHUNK_LINES lines, which only end between complete feature
+        hierarchies (a gene, its transcripts and their parts, wherever they
+        are in the file). Finding these takes a first, quick pass over the
+        file, so a file-like object which cannot seek is read into memory
+        first. The features of each sequence in a chunk are loaded
+        concurrently, in batches: transcripts without a parent gene with
+        addTranscript, anything else with addFeature. Failing batches are
+        reported rather than aborting the load.
+
+        Requires the bcbio-gff package.
+
+        :type organism: str
+        :param organism: Organism Common Name
+
+        :type gff3: str
+        :param gff3: Path of the GFF3 file (or a file-like object)
+
+        :type batch_size: int
+        :param batch_size: Maximum number of features per request (default: BATCH_SIZE)
+
+        :type workers: int
+        :param workers: Number of sequences loaded concurrently
+
+        :type progress: callable
+        :param progress: Called as ``progress(sequence, loaded, failed)``
+          after the features of a sequence in a chunk are loaded
+
+        :rtype: dict
+        :return: a summary of the load: number of features ``loaded``, list
+          of ``failures`` (sequence, feature names, error), ``elapsed``
+          seconds and ``features_per_second``
+        """
+        try:
+            from BCBio import GFF
+        except ImportError:
+            raise Exception("load_gff3 requires the bcbio-gff package")
+        from apollo.util import iterFeaturesToFeatureSchema
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+        if batch_size is None:
+            batch_size = self.BATCH_SIZE
+
+        lock = threading.Lock()
+        report = {
+            'loaded': 0,
+            'failures': [],
+        }
+
+        def load(sequence, others, transcripts):
+            loaded = 0
+            failed = 0
+            for client_method, batch_features in (('addFeature', others),
+                                                  ('addTranscript', transcripts)):
+                for data in self._batches(batch_features, organism, sequence, batch_size):
+                    batch = data['features']
+                    try:
+                        self._post_indexed(client_method, data)
+                        loaded += len(batch)
+                    except Exception as e:
+                        failed += len(batch)
+                        with lock:
+                            report['failures'].append({
+                                'sequence': sequence,
+                                'features': [f.get('name') for f in batch],
+                                'error': str(e),
+                            })
+            with lock:
+                report['loaded'] += loaded
+            if progress is not None:
+                progress(sequence, loaded, failed)
+
+        start = time.time()
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            pending = set()
+            handle = open(gff3) if not hasattr(gff3, 'read') else gff3
+            if handle is gff3:
+                try:
+                    gff3.seek(gff3.tell())
+                except Exception:
+                    # e.g. stdin, the chunks are found in a first pass
+                    handle = StringIO(gff3.read())
+            try:
+                for chunk in _gff3_chunks(handle, self.GFF3_CHUNK_LINES):
+                    for record in GFF.parse(StringIO(chunk)):
+                        others = []
+                        transcripts = []
+                        for feature in iterFeaturesToFeatureSchema(record.features):
+                            if feature['type']['name'] == 'mRNA':
+                                transcripts.append(feature)
+                            else:
+                                others.append(feature)
+                        if not others and not transcripts:
+                            continue
+                        # Bound the number of parsed chunks waiting to be sent
+                        if len(pending) >= workers * 2:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        pending.add(executor.submit(load, record.id, others, transcripts))
+            finally:
+                if handle is not gff3:
+                    handle.close()
+            for future in pending:
+                future.result()
+        finally:
+            executor.shutdown(wait=True)
+
+        report['elapsed'] = time.time() - start
+        report['features_per_second'] = report['loaded'] / report['elapsed'] if report['elapsed'] else 0
+        return report
+
+
+class AnnotationEditBuffer(object):
+    """
+    Write-behind queue of annotation edits, see
+    :meth:`AnnotationsClient.buffered`.
+
+    Edits are coalesced per feature before being sent:
+
+    - a newer name, status, symbol or description replaces a pending one
+    - deleting an attribute cancels a pending addition of the same attribute
+    - deleting a feature discards every pending edit of that feature
+
+    On flush, edits are grouped per operation, in the order: properties,
+    attribute deletions, attribute additions, feature deletions.
+
+    With ``max_age``, a timer thread flushes the edits once the oldest one
+    is that old. As nobody is there to catch it, an error raised by such a
+    flush is stored in ``last_error`` and the flush retried ``max_age``
+    seconds later.
+    """
+    # Pending edit kind -> Apollo operation
+    _SETTERS = OrderedDict([
+        ('name', 'setName'),
+        ('status', 'setStatus'),
+        ('symbol', 'setSymbol'),
+        ('description', 'setDescription'),
+    ])
+
+    def __init__(self, client, organism=None, sequence=None, max_edits=1000,
+                 max_age=None, batch_size=None):
+        self._client = client
+        self.organism = organism
+        self.sequence = sequence
+        self.max_edits = max_edits
+        self.max_age = max_age
+        self.batch_size = batch_size
+
+        self._lock = threading.RLock()
+        self._timer = None
+        self._reset()
+        # Number of edits made redundant by a later one, for monitoring
+        self.coalesced = 0
+        # Exception raised by the last flush made by the max_age timer
+        self.last_error = None
+
+    def _reset(self):
+        self._properties = OrderedDict()
+        self._attributes_added = OrderedDict()
+        self._attributes_deleted = OrderedDict()
+        self._deleted = OrderedDict()
+        self._oldest = None
+
+    def __len__(self):
+        with self._lock:
+            return (len(self._properties) + len(self._attributes_added) +
+                    len(self._attributes_deleted) + len(self._deleted))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Like a transaction, pending edits are only sent when the block
+        # completed successfully.
+        with self._lock:
+            try:
+                if exc_type is None:
+                    self.flush()
+            finally:
+                self._cancel_timer()
+
+    def _start_timer(self, delay):
+        self._cancel_timer()
+        self._timer = threading.Timer(delay, self._expired)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _expired(self):
+        with self._lock:
+            if self._oldest is None:
+                # Flushed while this timer was waiting for the lock
+                return
+            remaining = self._oldest + self.max_age - time.time()
+            if remaining > 0:
+                self._start_timer(remaining)
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                # flush re-armed the timer for the edits left in the queue
+                self.last_error = e
+
+    def _queued(self):
+        if self._oldest is None:
+            self._oldest = time.time()
+            if self.max_age is not None:
+                self._start_timer(self.max_age)
+
+        if len(self) >= self.max_edits:
+            self.flush()
+
+    def _set(self, kind, feature_id, value):
+        with self._lock:
+            if feature_id in self._deleted:
+                self.coalesced += 1
+                return
+            key = (kind, feature_id)
+            if key in self._properties:
+                self.coalesced += 1
+                del self._properties[key]
+            self._properties[key] = value
+            self._queued()
+
+    def set_name(self, feature_id, name):
+        """Queue a change of a feature's name"""
+        self._set('name', feature_id, name)
+
+    def set_status(self, feature_id, status):
+        """Queue a change of a feature's status"""
+        self._set('status', feature_id, status)
+
+    def set_symbol(self, feature_id, symbol):
+        """Queue a change of a feature's symbol"""
+        self._set('symbol', feature_id, symbol)
+
+    def set_description(self, feature_id, description):
+        """Queue a change of a feature's description"""
+        self._set('description', feature_id, description)
+
+    def add_attribute(self, feature_id, attribute_key, attribute_value):
+        """Queue the addition of an attribute to a feature"""
+        with self._lock:
+            if feature_id in self._deleted:
+                self.coalesced += 1
+                return
+            key = (feature_id, attribute_key, attribute_value)
+            if key in self._attributes_added:
+                self.coalesced += 1
+            else:
+                self._attributes_added[key] = True
+            self._queued()
+
+    def delete_attribute(self, feature_id, attribute_key, attribute_value):
+        """Queue the deletion of an attribute from a feature"""
+        with self._lock:
+            if feature_id in self._deleted:
+                self.coalesced += 1
+                return
+            key = (feature_id, attribute_key, attribute_value)
+            if key in self._attributes_added:
+                # Added and deleted again before ever reaching the server
+                del self._attributes_added[key]
+                self.coalesced += 2
+            elif key in self._attributes_deleted:
+                self.coalesced += 1
+            else:
+                self._attributes_deleted[key] = True
+            self._queued()
+
+    def delete_feature(self, feature_id):
+        """Queue the deletion of a feature, discarding its pending edits"""
+        with self._lock:
+            if feature_id in self._deleted:
+                self.coalesced += 1
+                return
+
+            for key in [k for k in self._properties if k[1] == feature_id]:
+                del self._properties[key]
+                self.coalesced += 1
+            for pending in (self._attributes_added, self._attributes_deleted):
+                for key in [k for k in pending if k[0] == feature_id]:
+                    del pending[key]
+                    self.coalesced += 1
+
+            self._deleted[feature_id] = True
+            self._queued()
+
+    def flush(self):
+        """
+        Send every pending edit to the server
+
+        Edits are removed from the buffer as their requests succeed. If a
+        request fails, its exception is raised and the edits it carried, as
+        well as those which were not sent yet, stay queued for the next
+        flush; the edits sent by the previous requests were applied.
+
+        :rtype: dict
+        :return: A standard apollo feature dictionary ({"features": [{...}]})
+          containing the results of every request
+        """
+        with self._lock:
+            self._cancel_timer()
+            try:
+                return self._send()
+            finally:
+                if len(self) == 0:
+                    self._oldest = None
+                elif self.max_age is not None:
+                    self._start_timer(self.max_age)
+
+    def _send(self):
+        # (operation, queue, [(queue key, feature)])
+        requests = []
+        for kind, operation in self._SETTERS.items():
+            edits = [
+                (key, {'uniquename': key[1], kind: value})
+                for (key, value) in self._properties.items()
+                if key[0] == kind
+            ]
+            requests.append((operation, self._properties, edits))
+
+        for operation, attributes in (('deleteAttribute', self._attributes_deleted),
+                                      ('addAttribute', self._attributes_added)):
+            edits = [
+                (key, {
+                    'uniquename': key[0],
+                    'non_reserved_properties': [
+                        {
+                            'tag': key[1],
+                            'value': key[2],
+                        }
+                    ]
+                })
+                for key in attributes
+            ]
+            requests.append((operation, attributes, edits))
+
+        requests.append(('deleteFeature', self._deleted,
+                         [(feature_id, {'uniquename': feature_id}) for feature_id in self._deleted]))
+
+        batch_size = self._client.BATCH_SIZE if self.batch_size is None else self.batch_size
+        if batch_size < 1:
+            raise Exception("batch_size must be a positive integer")
+
+        results = []
+        for operation, queue, edits in requests:
+            for i in range(0, len(edits), batch_size):
+                batch = edits[i:i + batch_size]
+                response = self._client._post_batched(
+                    operation, [feature for _, feature in batch],
+                    organism=self.organism, sequence=self.sequence,
+                    batch_size=batch_size)
+                for key, _ in batch:
+                    del queue[key]
+                results.extend(response['features'])
+
+        return {'features': results}
@@ -6,6 +6,12 @@ from apollo.client import Client
 
 class CannedCommentsClient(Client):
     CLIENT_BASE = '/cannedComment/'
+    READ_METHODS = frozenset([
+        'showComment',
+    ])
+    IDEMPOTENT_METHODS = READ_METHODS | frozenset([
+        'updateComment',
+    ])
 
     def add_comment(self, comment, metadata=""):
         """
@@ -6,6 +6,12 @@ from apollo.client import Client
 
 class CannedKeysClient(Client):
     CLIENT_BASE = '/cannedKey/'
+    READ_METHODS = frozenset([
+        'showKey',
+    ])
+    IDEMPOTENT_METHODS = READ_METHODS | frozenset([
+        'updateKey',
+    ])
 
     def add_key(self, key, metadata=""):
         """
@@ -6,6 +6,12 @@ from apollo.client import Client
 
 class CannedValuesClient(Client):
     CLIENT_BASE = '/cannedValue/'
+    READ_METHODS = frozenset([
+        'showValue',
+    ])
+    IDEMPOTENT_METHODS = READ_METHODS | frozenset([
+        'updateValue',
+    ])
 
     def add_value(self, value, metadata=""):
         """
@@ -1,7 +1,492 @@
 """Base apollo client
 """
 import json
+import random
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from apollo.exceptions import CircuitOpenException, UnexpectedResponseException
+
+
+def build_session(pool_connections=10, pool_maxsize=10, pool_block=False,
+                  keep_alive=True):
+    """
+    Build a pooled HTTP session, shared by every client of an ApolloInstance
+
+    :type pool_connections: int
+    :param pool_connections: Number of per-host connection pools to keep
+
+    :type pool_maxsize: int
+    :param pool_maxsize: Maximum number of connections kept open per host
+
+    :type pool_block: bool
+    :param pool_block: Block when all connections of a host are busy, rather
+      than opening (and then discarding) additional connections
+
+    :type keep_alive: bool
+    :param keep_alive: Reuse connections between requests
+
+    :rtype: requests.Session
+    :return: the configured session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections,
+                          pool_maxsize=pool_maxsize,
+                          pool_block=pool_block)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+    return session
+
+
+def _not_sent(error):
+    """Whether a failed request certainly never reached the server"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class RetryPolicy(object):
+    """
+    When and how often requests failing with a transient error are sent
+    again, shared by every client of an ApolloInstance. Delays grow
+    exponentially, with "full jitter" so that many clients retrying at once
+    do not hit the server in lockstep.
+
+    Requests to endpoints listed in a client's ``IDEMPOTENT_METHODS`` (and
+    GET requests) are retried on connection errors, timeouts and the
+    configured status codes. Other requests are only retried when they could
+    not have reached the server, unless ``retry_writes`` is set.
+
+    :type retries: int
+    :param retries: Maximum number of retries of a request (0 disables retrying)
+
+    :type status_codes: tuple
+    :param status_codes: HTTP statuses worth retrying
+
+    :type backoff_factor: float
+    :param backoff_factor: Base delay in seconds, doubled after every retry
+
+    :type backoff_max: float
+    :param backoff_max: Maximum delay between two attempts, in seconds
+
+    :type max_elapsed: float
+    :param max_elapsed: Give up once a request would take longer than this
+      many seconds in total (None for no limit)
+
+    :type jitter: bool
+    :param jitter: Pick each delay at random between 0 and its exponential value
+
+    :type retry_writes: bool
+    :param retry_writes: Retry non idempotent requests like idempotent ones
+    """
+
+    def __init__(self, retries=3, status_codes=(429, 502, 503, 504),
+                 backoff_factor=0.5, backoff_max=30, max_elapsed=300,
+                 jitter=True, retry_writes=False):
+        self.retries = retries
+        self.status_codes = frozenset(status_codes)
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.max_elapsed = max_elapsed
+        self.jitter = jitter
+        self.retry_writes = retry_writes
+
+        self._lock = threading.Lock()
+        self._counters = {
+            'requests': 0,
+            'retries': 0,
+            'recovered': 0,
+            'exhausted': 0,
+        }
+        self._reasons = {}
+
+    def delay(self, attempt, start, idempotent, response=None, error=None):
+        """
+        Seconds to wait before sending a failed request again
+
+        :type attempt: int
+        :param attempt: Number of retries already made
+
+        :type start: float
+        :param start: Time of the first attempt
+
+        :type idempotent: bool
+        :param idempotent: Whether the request may safely be sent twice
+
+        :rtype: float
+        :return: the delay, or None if the request should not be retried
+        """
+        if attempt >= self.retries:
+            return None
+
+        retry_after = None
+        if response is not None:
+            if response.status_code not in self.status_codes:
+                return None
+            if not (idempotent or self.retry_writes):
+                return None
+            retry_after = response.headers.get('Retry-After')
+        elif not isinstance(error, (requests.exceptions.ConnectionError,
+                                    requests.exceptions.Timeout)):
+            return None
+        elif not (idempotent or self.retry_writes or _not_sent(error)):
+            return None
+
+        delay = min(self.backoff_max, self.backoff_factor * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        if retry_after is not None:
+            try:
+                delay = max(delay, min(float(retry_after), self.backoff_max))
+            except ValueError:
+                # An HTTP date, rather than a number of seconds
+                pass
+
+        if self.max_elapsed is not None and time.time() + delay - start > self.max_elapsed:
+            return None
+        return delay
+
+    def _retrying(self, reason):
+        with self._lock:
+            self._counters['retries'] += 1
+            self._reasons[reason] = self._reasons.get(reason, 0) + 1
+
+    def _finished(self, attempts, success):
+        with self._lock:
+            self._counters['requests'] += 1
+            if attempts:
+                self._counters['recovered' if success else 'exhausted'] += 1
+
+    def stats(self):
+        """
+        Retry counters, for monitoring
+
+        :rtype: dict
+        :return: number of ``requests`` sent, ``retries`` made, requests
+          which succeeded after retrying (``recovered``) and which failed
+          despite retrying (``exhausted``), plus the number of retries per
+          status code or exception name under ``reasons``
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['reasons'] = dict(self._reasons)
+        return stats
+
+
+class RateLimiter(object):
+    """
+    Token bucket limiting the rate of requests sent to the server, shared by
+    every client of an ApolloInstance
+
+    :type rate: float
+    :param rate: Sustained number of requests per second
+
+    :type burst: int
+    :param burst: Number of requests which may be sent at once after an
+      idle period (default: one second's worth, at least 1)
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise Exception("rate must be positive")
+        self.rate = float(rate)
+        self.burst = max(1, int(rate) if burst is None else burst)
+        self._tokens = float(self.burst)
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait for a token"""
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ConcurrencyLimiter(object):
+    """
+    Adaptive limit on the number of requests in flight, shared by every
+    client of an ApolloInstance. The limit follows AIMD: it grows by one
+    after a limit's worth of fast, successful responses, and is multiplied
+    by ``decrease`` when a response is slow, the server reports overload
+    (429 or 5xx) or the connection fails, so concurrent bulk jobs back off
+    as soon as the server struggles.
+
+    :type initial: int
+    :param initial: Starting limit
+
+    :type minimum: int
+    :param minimum: Lowest limit
+
+    :type maximum: int
+    :param maximum: Highest limit
+
+    :type latency_target: float
+    :param latency_target: Responses slower than this many seconds count as
+      a sign of overload
+
+    :type decrease: float
+    :param decrease: Factor applied to the limit on overload
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=32, latency_target=2.0,
+                 decrease=0.5):
+        self.minimum = max(1, minimum)
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self._limit = float(max(minimum, min(maximum, initial)))
+        self._in_flight = 0
+        self._last_decrease = 0
+        self._cond = threading.Condition()
+        self._counters = {
+            'requests': 0,
+            'overloaded': 0,
+            'waited': 0,
+        }
+
+    @property
+    def limit(self):
+        """Current number of requests allowed in flight"""
+        return int(self._limit)
+
+    def acquire(self):
+        """Wait until a request may be sent"""
+        with self._cond:
+            if self._in_flight >= int(self._limit):
+                self._counters['waited'] += 1
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self, latency, overloaded=False):
+        """
+        Record the outcome of a request sent after :meth:`acquire`
+
+        :type latency: float
+        :param latency: Seconds taken by the request
+
+        :type overloaded: bool
+        :param overloaded: Whether the server failed or reported overload
+        """
+        with self._cond:
+            self._in_flight -= 1
+            self._counters['requests'] += 1
+            now = time.time()
+            if overloaded or latency > self.latency_target:
+                self._counters['overloaded'] += 1
+                # Requests sent before the previous decrease report the same
+                # congestion, only back off once per round trip
+                if now - self._last_decrease > latency:
+                    self._limit = max(self.minimum, self._limit * self.decrease)
+                    self._last_decrease = now
+            else:
+                self._limit = min(self.maximum, self._limit + 1.0 / int(self._limit))
+            self._cond.notify_all()
+
+    def stats(self):
+        """
+        Limiter state, for monitoring
+
+        :rtype: dict
+        :return: current ``limit``, requests ``in_flight``, number of
+          ``requests`` completed, of ``overloaded`` responses, and of
+          requests which ``waited`` for a slot
+        """
+        with self._cond:
+            stats = dict(self._counters)
+            stats['limit'] = int(self._limit)
+            stats['in_flight'] = self._in_flight
+        return stats
+
+
+class CircuitBreaker(object):
+    """
+    Stop sending requests to a server which keeps failing, shared by every
+    client of an ApolloInstance. After ``failure_threshold`` consecutive
+    failures (connection errors, timeouts or 5xx statuses) the breaker opens
+    and requests fail immediately with
+    :class:`apollo.exceptions.CircuitOpenException`. After ``reset_timeout``
+    seconds it is half-open: up to ``half_open_requests`` trial requests are
+    sent, closing the breaker if one succeeds and opening it again if one
+    fails.
+
+    :type failure_threshold: int
+    :param failure_threshold: Consecutive failures opening the breaker
+
+    :type reset_timeout: float
+    :param reset_timeout: Seconds before trial requests are let through
+
+    :type half_open_requests: int
+    :param half_open_requests: Number of concurrent trial requests
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, half_open_requests=1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_requests = half_open_requests
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trials = 0
+        self._counters = {
+            'trips': 0,
+            'rejected': 0,
+        }
+
+    @property
+    def state(self):
+        """``closed``, ``open`` or ``half-open``"""
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and time.time() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trials = 0
+        return self._state
+
+    def before_request(self):
+        """
+        Let a request through, or raise
+        :class:`apollo.exceptions.CircuitOpenException`
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and self._trials < self.half_open_requests:
+                self._trials += 1
+                return
+            self._counters['rejected'] += 1
+            if state == self.OPEN:
+                retry_in = self._opened_at + self.reset_timeout - time.time()
+            else:
+                # Waiting for the outcome of the trial requests
+                retry_in = 0
+            raise CircuitOpenException(max(0, retry_in))
+
+    def record(self, success):
+        """
+        Record the outcome of a request let through by :meth:`before_request`
+
+        :type success: bool
+        :param success: Whether the server answered without failing
+        """
+        with self._lock:
+            state = self._current_state()
+            if success:
+                self._failures = 0
+                if state == self.HALF_OPEN:
+                    self._state = self.CLOSED
+                return
+
+            self._failures += 1
+            if state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if state != self.OPEN:
+                    self._counters['trips'] += 1
+                self._state = self.OPEN
+                self._opened_at = time.time()
+
+    def reset(self):
+        """Close the breaker"""
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def stats(self):
+        """
+        Breaker state, for monitoring
+
+        :rtype: dict
+        :return: the ``state``, number of consecutive ``failures``, time the
+          breaker last opened (``opened_at``), number of ``trips`` and of
+          requests ``rejected`` while open
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['state'] = self._current_state()
+            stats['failures'] = self._failures
+            stats['opened_at'] = self._opened_at
+        return stats
+
+
+class SingleFlight(object):
+    """
+    Coalesce identical concurrent read requests, shared by every client of
+    an ApolloInstance: while a request is in flight, callers making the same
+    request wait for it and share its response rather than sending their own.
+    Each caller decodes the response body itself, so results are never
+    shared between callers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counters = {
+            'calls': 0,
+            'coalesced': 0,
+        }
+
+    def do(self, key, fn):
+        """
+        Call ``fn``, or wait for the call in flight with the same ``key``
+
+        :rtype: object
+        :return: the value returned by ``fn`` (or raise its exception)
+        """
+        with self._lock:
+            self._counters['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event()}
+            else:
+                self._counters['coalesced'] += 1
+
+        if leader:
+            try:
+                call['result'] = fn()
+            except Exception as e:
+                call['error'] = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call['done'].set()
+        else:
+            call['done'].wait()
+
+        if 'error' in call:
+            raise call['error']
+        return call['result']
+
+    def stats(self):
+        """
+        Coalescing counters, for monitoring
+
+        :rtype: dict
+        :return: number of read ``calls`` and of calls ``coalesced`` with
+          one already in flight
+        """
+        with self._lock:
+            return dict(self._counters)
 
 
 class Client(object):
@@ -9,11 +494,17 @@ class Client(object):
     Base client class implementing methods to make requests to the server
     """
     CLIENT_BASE = '/'
+    # Endpoints which only read data, see SingleFlight
+    READ_METHODS = frozenset()
+    # Endpoints which may safely be sent again, see RetryPolicy
+    IDEMPOTENT_METHODS = frozenset()
+    # Other modules whose cached responses a write to this one makes stale
+    INVALIDATES = ()
 
     def __init__(self, webapolloinstance, **requestArgs):
         self._wa = webapolloinstance
 
-        self.__verify = requestArgs.get('verify', True)
+        self._verify = requestArgs.get('verify', True)
         self._request_args = requestArgs
 
         if 'verify' in self._request_args:
@@ -21,50 +512,153 @@ class Client(object):
 
     def post(self, client_method, data, post_params=None, is_json=True):
         """Make a POST request"""
-        url = self._wa.apollo_url + self.CLIENT_BASE + client_method
+        if client_method in self.READ_METHODS:
+            payload = json.dumps([data, post_params], sort_keys=True)
+            text = self._read('POST', client_method, payload, lambda: self._post_response(
+                client_method, data, post_params=post_params).text)
+            if is_json:
+                return self._scrub_data(json.loads(text))
+            return text
 
+        resp = self._post_response(client_method, data, post_params=post_params)
+        if is_json:
+            data = resp.json()
+            return self._scrub_data(data)
+        else:
+            return resp.text
+
+    def post_stream(self, client_method, data, post_params=None, headers=None):
+        """
+        Make a POST request, without reading the response body. The response
+        should be closed once read (e.g. with ``contextlib.closing``).
+        """
+        return self._post_response(client_method, data, post_params=post_params,
+                                   stream=True, extra_headers=headers)
+
+    def _post_response(self, client_method, data, post_params=None,
+                       stream=False, extra_headers=None):
         if post_params is None:
             post_params = {}
 
         headers = {
             'Content-Type': 'application/json'
         }
+        if extra_headers:
+            headers.update(extra_headers)
 
         data.update({
             'username': self._wa.username,
             'password': self._wa.password,
         })
 
-        resp = requests.post(url, data=json.dumps(data),
-                             headers=headers, verify=self.__verify,
-                             params=post_params, allow_redirects=False,
-                             **self._request_args)
-
-        if resp.status_code == 200 or resp.status_code == 302:
-            if is_json:
-                data = resp.json()
-                return self._scrub_data(data)
-            else:
-                return resp.text
-
-        # @see self.body for HTTP response body
-        raise Exception("Unexpected response from apollo %s: %s" %
-                        (resp.status_code, resp.text))
+        try:
+            # 206 only answers requests for a byte range
+            return self._request('POST', client_method, (200, 206, 302),
+                                 data=json.dumps(data), headers=headers,
+                                 verify=self._verify, params=post_params,
+                                 allow_redirects=False, stream=stream,
+                                 **self._request_args)
+        finally:
+            cache = getattr(self._wa, 'response_cache', None)
+            if cache is not None and client_method not in self.READ_METHODS:
+                # Even a failed write may have changed something
+                cache.invalidate(self._wa, (self.CLIENT_BASE,) + tuple(self.INVALIDATES))
 
     def get(self, client_method, get_params):
         """Make a GET request"""
-        url = self._wa.apollo_url + self.CLIENT_BASE + client_method
         headers = {}
 
-        response = requests.get(url, headers=headers,
-                                verify=self.__verify, params=get_params,
-                                **self._request_args)
-        if response.status_code == 200:
-            data = response.json()
-            return self._scrub_data(data)
-        # @see self.body for HTTP response body
-        raise Exception("Unexpected response from apollo %s: %s" %
-                        (response.status_code, response.text))
+        def fetch():
+            return self._request('GET', client_method, (200,),
+                                 headers=headers, verify=self._verify,
+                                 params=get_params, **self._request_args).text
+
+        text = self._read('GET', client_method, json.dumps(get_params, sort_keys=True), fetch)
+        data = json.loads(text)
+        return self._scrub_data(data)
+
+    def _read(self, method, client_method, payload, fetch):
+        """Response body of a read request, from the instance's response
+        cache or shared with an identical request in flight"""
+        flight = getattr(self._wa, 'single_flight', None)
+
+        def fetch_once():
+            if flight is None:
+                return fetch()
+            return flight.do((method, self.CLIENT_BASE + client_method, payload), fetch)
+
+        cache = getattr(self._wa, 'response_cache', None)
+        if cache is not None:
+            return cache.fetch(self._wa, self.CLIENT_BASE, client_method,
+                               method + payload, fetch_once)
+        return fetch_once()
+
+    def _request(self, method, client_method, ok_statuses, **kwargs):
+        """Send a request, retrying transient failures as configured by the
+        instance's RetryPolicy"""
+        url = self._wa.apollo_url + self.CLIENT_BASE + client_method
+        policy = getattr(self._wa, 'retry', None) or None
+        idempotent = method == 'GET' or client_method in self.IDEMPOTENT_METHODS
+
+        start = time.time()
+        attempt = 0
+        while True:
+            try:
+                resp = self._send(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                delay = None if policy is None else policy.delay(attempt, start, idempotent, error=e)
+                if delay is None:
+                    if policy is not None:
+                        policy._finished(attempt, False)
+                    raise
+                reason = type(e).__name__
+            else:
+                if resp.status_code in ok_statuses:
+                    if policy is not None:
+                        policy._finished(attempt, True)
+                    return resp
+
+                delay = None if policy is None else policy.delay(attempt, start, idempotent, response=resp)
+                if delay is None:
+                    if policy is not None:
+                        policy._finished(attempt, False)
+                    # @see self.body for HTTP response body
+                    raise UnexpectedResponseException(resp.status_code, resp.text)
+                reason = str(resp.status_code)
+                resp.close()
+
+            policy._retrying(reason)
+            time.sleep(delay)
+            attempt += 1
+
+    def _send(self, method, url, **kwargs):
+        """Send a single request, through the instance's circuit breaker and
+        within its rate and concurrency limits. Streamed responses hold their
+        slot until the headers are read."""
+        breaker = getattr(self._wa, 'circuit_breaker', None)
+        rate_limiter = getattr(self._wa, 'rate_limiter', None)
+        concurrency_limiter = getattr(self._wa, 'concurrency_limiter', None)
+
+        if breaker is not None:
+            breaker.before_request()
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        if concurrency_limiter is not None:
+            concurrency_limiter.acquire()
+
+        start = time.time()
+        status_code = None
+        try:
+            resp = self._wa.session.request(method, url, **kwargs)
+            status_code = resp.status_code
+            return resp
+        finally:
+            if concurrency_limiter is not None:
+                overloaded = status_code is None or status_code == 429 or status_code >= 500
+                concurrency_limiter.release(time.time() - start, overloaded=overloaded)
+            if breaker is not None:
+                # Rate limiting (429) means the server is up
+                breaker.record(status_code is not None and status_code < 500)
 
     @classmethod
     def _scrub_data(cls, data):
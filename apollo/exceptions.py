@@ -1,2 +1,43 @@
 class UnknownUserException(Exception):
     pass
+
+
+class UnexpectedResponseException(Exception):
+    """The Apollo server answered with an unexpected HTTP status"""
+
+    def __init__(self, status_code, body):
+        super(UnexpectedResponseException, self).__init__(
+            "Unexpected response from apollo %s: %s" % (status_code, body))
+        self.status_code = status_code
+        self.body = body
+
+
+class CircuitOpenException(Exception):
+    """Requests are not sent while the circuit breaker is open"""
+
+    def __init__(self, retry_in):
+        super(CircuitOpenException, self).__init__(
+            "Apollo server unavailable, circuit breaker open for another %.1fs" % retry_in)
+        self.retry_in = retry_in
+
+
+class BatchException(Exception):
+    """
+    A request of a batched edit failed. The features of the batches sent
+    before it were applied, those of the failing batch and of the following
+    ones were not (the latter were not sent at all).
+    """
+
+    def __init__(self, error, applied, failed, unsent, results):
+        total = len(applied) + len(failed) + len(unsent)
+        super(BatchException, self).__init__(
+            "Batch request failed, %d of %d features were applied: %s" % (len(applied), total, error))
+        self.error = error
+        # Input features, by outcome
+        self.applied = applied
+        self.failed = failed
+        self.unsent = unsent
+        # Features returned by the successful requests
+        self.results = results
+        if hasattr(error, 'status_code'):
+            self.status_code = error.status_code
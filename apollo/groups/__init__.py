@@ -9,6 +9,17 @@ from apollo.users import _fix_user as _fix_group
 
 class GroupsClient(Client):
     CLIENT_BASE = '/group/'
+    READ_METHODS = frozenset([
+        'getOrganismPermissionsForGroup',
+        'loadGroups',
+    ])
+    IDEMPOTENT_METHODS = READ_METHODS | frozenset([
+        'updateGroup',
+        'updateMembership',
+        'updateOrganismPermission',
+    ])
+    # Group membership and permissions are part of both users and groups
+    INVALIDATES = ('/user/',)
 
     def create_group(self, name):
         """
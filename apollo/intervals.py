@@ -0,0 +1,425 @@
+"""
+In-memory interval index over Apollo features
+"""
+import random
+import threading
+from bisect import bisect_left, bisect_right
+
+
+class _Node(object):
+    __slots__ = ('key', 'start', 'end', 'item', 'priority', 'max_end', 'left', 'right')
+
+    def __init__(self, uniquename, start, end, item, priority):
+        self.key = (start, end, uniquename)
+        self.start = start
+        self.end = end
+        self.item = item
+        self.priority = priority
+        self.max_end = end
+        self.left = None
+        self.right = None
+
+
+def _update(node):
+    max_end = node.end
+    if node.left is not None and node.left.max_end > max_end:
+        max_end = node.left.max_end
+    if node.right is not None and node.right.max_end > max_end:
+        max_end = node.right.max_end
+    node.max_end = max_end
+
+
+def _split(node, key):
+    """Split a tree into the nodes before ``key`` and the others"""
+    if node is None:
+        return None, None
+    if node.key < key:
+        left, right = _split(node.right, key)
+        node.right = left
+        _update(node)
+        return node, right
+    left, right = _split(node.left, key)
+    node.left = right
+    _update(node)
+    return left, node
+
+
+def _merge(left, right):
+    """Join two trees, every node of ``left`` being before those of ``right``"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+def _remove(node, key):
+    if node is None:
+        return None
+    if key < node.key:
+        node.left = _remove(node.left, key)
+    elif node.key < key:
+        node.right = _remove(node.right, key)
+    else:
+        return _merge(node.left, node.right)
+    _update(node)
+    return node
+
+
+def _build(nodes, lo, hi):
+    """Balanced tree of sorted ``nodes[lo:hi]``, priorities not yet set"""
+    if lo >= hi:
+        return None
+    mid = (lo + hi) // 2
+    node = nodes[mid]
+    node.left = _build(nodes, lo, mid)
+    node.right = _build(nodes, mid + 1, hi)
+    _update(node)
+    return node
+
+
+def _search(node, start, end, hits):
+    """Append the nodes overlapping [start, end) to ``hits``, in order"""
+    while node is not None and node.max_end > start:
+        _search(node.left, start, end, hits)
+        if node.start >= end:
+            return
+        if node.end > start:
+            hits.append(node)
+        node = node.right
+
+
+class _IntervalList(object):
+    """
+    Features of a single sequence and strand, as an interval tree: a treap
+    ordered by start, each node holding the maximum end of its subtree, so
+    that queries skip the subtrees ending before the region and features are
+    added or removed in logarithmic time. Ends are also kept in a sorted
+    list, to find the feature ending closest before a position.
+    """
+
+    # Adding more than this fraction of the current features at once
+    # rebuilds the tree rather than inserting them one by one
+    REBUILD_RATIO = 0.25
+
+    def __init__(self):
+        # uniquename -> (fmin, fmax, feature)
+        self.features = {}
+        self._nodes = {}
+        self._root = None
+        self._ends = []
+        self._end_names = []
+        self._random = random.Random()
+
+    def __len__(self):
+        return len(self.features)
+
+    def add(self, uniquename, fmin, fmax, feature):
+        self.add_many([(uniquename, fmin, fmax, feature)])
+
+    def add_many(self, entries):
+        """Add (or replace) (uniquename, fmin, fmax, feature) entries"""
+        latest = {}
+        for entry in entries:
+            latest[entry[0]] = entry
+        for uniquename in latest:
+            self.remove(uniquename)
+
+        nodes = []
+        for uniquename, fmin, fmax, feature in latest.values():
+            node = _Node(uniquename, fmin, fmax, feature, self._random.random())
+            self.features[uniquename] = (fmin, fmax, feature)
+            self._nodes[uniquename] = node
+            nodes.append(node)
+
+        if len(nodes) > self.REBUILD_RATIO * len(self.features):
+            self._rebuild()
+            return
+        for node in nodes:
+            left, right = _split(self._root, node.key)
+            self._root = _merge(_merge(left, node), right)
+            i = bisect_right(self._ends, node.end)
+            self._ends.insert(i, node.end)
+            self._end_names.insert(i, node.key[2])
+
+    def _rebuild(self):
+        ends = sorted((n.end, n.key[2]) for n in self._nodes.values())
+        self._ends = [x[0] for x in ends]
+        self._end_names = [x[1] for x in ends]
+
+        nodes = sorted(self._nodes.values(), key=lambda n: n.key)
+        self._root = _build(nodes, 0, len(nodes))
+        # Priorities decreasing with depth keep the balanced shape a valid
+        # treap, for the nodes inserted later
+        priorities = sorted((self._random.random() for _ in nodes), reverse=True)
+        level = [self._root] if self._root is not None else []
+        i = 0
+        while level:
+            children = []
+            for node in level:
+                node.priority = priorities[i]
+                i += 1
+                children.extend(x for x in (node.left, node.right) if x is not None)
+            level = children
+
+    def remove(self, uniquename):
+        node = self._nodes.pop(uniquename, None)
+        if node is None:
+            return
+        del self.features[uniquename]
+        self._root = _remove(self._root, node.key)
+        i = self._end_names.index(uniquename, bisect_left(self._ends, node.end))
+        del self._ends[i]
+        del self._end_names[i]
+
+    def overlapping(self, start, end):
+        """(fmin, fmax, feature) of the intervals overlapping [start, end), sorted by start"""
+        hits = []
+        _search(self._root, start, end, hits)
+        return [(n.start, n.end, n.item) for n in hits]
+
+    def upstream(self, position):
+        """(fmin, fmax, feature) of the interval ending closest before ``position``"""
+        i = bisect_right(self._ends, position)
+        return self.features[self._end_names[i - 1]] if i > 0 else None
+
+    def downstream(self, position):
+        """(fmin, fmax, feature) of the interval starting closest after ``position``"""
+        node = self._root
+        best = None
+        while node is not None:
+            if node.start >= position:
+                best = node
+                node = node.left
+            else:
+                node = node.right
+        return (best.start, best.end, best.item) if best is not None else None
+
+
+class FeatureIndex(object):
+    """
+    Index of Apollo features per sequence and strand, answering overlap,
+    containment and nearest feature queries without scanning every feature.
+
+    Coordinates are Apollo's: zero-based and half-open (``fmin``, ``fmax``).
+    Indexes built with :meth:`apollo.annotations.AnnotationsClient.build_index`
+    are kept up to date as the client adds, resizes or deletes features.
+
+    Indexes can be shared between threads, every method holding a lock.
+    """
+
+    def __init__(self, features=None, sequence=None):
+        self._lock = threading.RLock()
+        # sequence -> strand -> _IntervalList
+        self._sequences = {}
+        # uniquename -> (sequence, strand)
+        self._locations = {}
+        if features is not None:
+            self.add_features(features, sequence=sequence)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._locations)
+
+    def __contains__(self, uniquename):
+        with self._lock:
+            return uniquename in self._locations
+
+    def add_features(self, features, sequence=None):
+        """
+        Add (or replace) features
+
+        :type features: dict
+        :param features: A standard apollo feature dictionary
+          ({"features": [{...}]}), or a list of features
+
+        :type sequence: str
+        :param sequence: Sequence Name, for features which do not specify theirs
+        """
+        with self._lock:
+            if isinstance(features, dict):
+                features = features.get('features', [])
+            latest = {}
+            for feature in features:
+                entry = self._entry(feature, sequence)
+                if entry is not None:
+                    latest[entry[1]] = entry
+            # Added per interval list, in bulk
+            pending = {}
+            for entry in latest.values():
+                pending.setdefault(entry[0], []).append(entry[1:])
+            for key, entries in pending.items():
+                sequence, strand = key
+                strands = self._sequences.setdefault(sequence, {})
+                strands.setdefault(strand, _IntervalList()).add_many(entries)
+                for entry in entries:
+                    self._locations[entry[0]] = key
+
+    def _entry(self, feature, sequence):
+        """((sequence, strand), uniquename, fmin, fmax, feature), removing
+        the feature from its current list, or None if it has no location"""
+        location = feature.get('location')
+        if location is None or 'fmin' not in location or 'fmax' not in location:
+            return None
+        sequence = feature.get('sequence', sequence)
+        if sequence is None:
+            raise Exception("Unknown sequence for feature %s" % feature.get('uniquename'))
+
+        uniquename = feature['uniquename']
+        self.remove(uniquename)
+        return ((sequence, location.get('strand')), uniquename,
+                location['fmin'], location['fmax'], feature)
+
+    def add(self, feature, sequence=None):
+        """
+        Add (or replace) a single feature
+
+        :type feature: dict
+        :param feature: Apollo feature, with a ``uniquename`` and ``location``
+
+        :type sequence: str
+        :param sequence: Sequence Name, if the feature does not specify it
+        """
+        self.add_features([feature], sequence=sequence)
+
+    def remove(self, uniquename):
+        """
+        Remove a feature from the index, if present
+
+        :type uniquename: str
+        :param uniquename: Feature UUID
+        """
+        with self._lock:
+            position = self._locations.pop(uniquename, None)
+            if position is not None:
+                sequence, strand = position
+                self._sequences[sequence][strand].remove(uniquename)
+
+    def set_location(self, uniquename, fmin=None, fmax=None):
+        """
+        Move the boundaries of an indexed feature
+
+        :type uniquename: str
+        :param uniquename: Feature UUID
+
+        :type fmin: int
+        :param fmin: New start, or None to keep the current one
+
+        :type fmax: int
+        :param fmax: New end, or None to keep the current one
+        """
+        with self._lock:
+            if uniquename not in self._locations:
+                return
+            sequence, strand = self._locations[uniquename]
+            old_fmin, old_fmax, feature = self._sequences[sequence][strand].features[uniquename]
+            feature['location'] = dict(
+                feature['location'],
+                fmin=old_fmin if fmin is None else fmin,
+                fmax=old_fmax if fmax is None else fmax,
+            )
+            self.add(feature, sequence=sequence)
+
+    def _lists(self, sequence, strand):
+        strands = self._sequences.get(sequence, {})
+        if strand is None:
+            return list(strands.values())
+        return [strands[strand]] if strand in strands else []
+
+    def overlapping(self, sequence, start, end, strand=None):
+        """
+        Features overlapping a region
+
+        :type sequence: str
+        :param sequence: Sequence Name
+
+        :type start: int
+        :param start: Region start
+
+        :type end: int
+        :param end: Region end
+
+        :type strand: int
+        :param strand: Only consider features on this strand (default is both)
+
+        :rtype: list
+        :return: the matching features, sorted by start
+        """
+        with self._lock:
+            hits = []
+            for intervals in self._lists(sequence, strand):
+                hits.extend(intervals.overlapping(start, end))
+            hits.sort(key=lambda x: (x[0], x[1]))
+            return [x[2] for x in hits]
+
+    def contained(self, sequence, start, end, strand=None):
+        """
+        Features lying entirely within a region
+
+        :rtype: list
+        :return: the matching features, sorted by start
+        """
+        return [
+            f for f in self.overlapping(sequence, start, end, strand=strand)
+            if f['location']['fmin'] >= start and f['location']['fmax'] <= end
+        ]
+
+    def containing(self, sequence, start, end, strand=None):
+        """
+        Features spanning the whole of a region
+
+        :rtype: list
+        :return: the matching features, sorted by start
+        """
+        return [
+            f for f in self.overlapping(sequence, start, end, strand=strand)
+            if f['location']['fmin'] <= start and f['location']['fmax'] >= end
+        ]
+
+    def nearest(self, sequence, start, end=None, strand=None):
+        """
+        Feature closest to a region (or position), overlapping features
+        being at distance 0
+
+        :type sequence: str
+        :param sequence: Sequence Name
+
+        :type start: int
+        :param start: Region start
+
+        :type end: int
+        :param end: Region end (default: start + 1)
+
+        :type strand: int
+        :param strand: Only consider features on this strand (default is both)
+
+        :rtype: dict
+        :return: the closest feature, or None if the sequence has no features
+        """
+        with self._lock:
+            if end is None:
+                end = start + 1
+
+            overlapping = self.overlapping(sequence, start, end, strand=strand)
+            if overlapping:
+                return overlapping[0]
+
+            best = None
+            for intervals in self._lists(sequence, strand):
+                hit = intervals.upstream(start)
+                if hit is not None:
+                    distance = start - hit[1]
+                    if best is None or distance < best[0]:
+                        best = (distance, hit[2])
+                hit = intervals.downstream(end)
+                if hit is not None:
+                    distance = hit[0] - end
+                    if best is None or distance < best[0]:
+                        best = (distance, hit[2])
+            return best[1] if best is not None else None
@@ -1,11 +1,247 @@
 """
 Contains possible interactions with the Apollo IO Module
 """
+import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+import requests
+
 from apollo.client import Client
+from apollo.exceptions import UnexpectedResponseException
+
+
+def _write_chunks(resp, handle, decompressor, chunk_size):
+    written = 0
+    for chunk in resp.iter_content(chunk_size=chunk_size):
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        handle.write(chunk)
+        written += len(chunk)
+    if decompressor is not None:
+        chunk = decompressor.flush()
+        handle.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def _verify_checksum(path, checksum_type, expected, digest=False):
+    if expected is None:
+        return
+    hasher = hashlib.new(checksum_type)
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    actual = hasher.digest() if digest else hasher.hexdigest()
+    if not digest:
+        expected = expected.lower()
+    if actual != expected:
+        raise Exception("%s checksum mismatch for %s" % (checksum_type, path))
+
+
+def _lines(shard):
+    # Shards may not end with a newline
+    for line in shard:
+        yield line if line.endswith(b'\n') else line + b'\n'
+
+
+def _merge_shards(shard_paths, handle, export_type):
+    """Concatenate exported shards, keeping a single GFF3 header and moving
+    every embedded FASTA section after all of the features"""
+    written = 0
+    if export_type.upper() != 'GFF3':
+        for shard_path in shard_paths:
+            with open(shard_path, 'rb') as shard:
+                for line in _lines(shard):
+                    handle.write(line)
+                    written += len(line)
+        return written
+
+    fasta_offsets = []
+    header_written = False
+    for shard_path in shard_paths:
+        fasta_offset = None
+        with open(shard_path, 'rb') as shard:
+            while True:
+                line = shard.readline()
+                if not line:
+                    break
+                if not line.endswith(b'\n'):
+                    line += b'\n'
+                if line.startswith(b'##gff-version'):
+                    if header_written:
+                        continue
+                    header_written = True
+                elif line.startswith(b'##FASTA'):
+                    fasta_offset = shard.tell()
+                    break
+                handle.write(line)
+                written += len(line)
+        fasta_offsets.append(fasta_offset)
+
+    if any(offset is not None for offset in fasta_offsets):
+        handle.write(b'##FASTA\n')
+        written += len(b'##FASTA\n')
+        for shard_path, offset in zip(shard_paths, fasta_offsets):
+            if offset is None:
+                continue
+            with open(shard_path, 'rb') as shard:
+                shard.seek(offset)
+                for line in _lines(shard):
+                    handle.write(line)
+                    written += len(line)
+    return written
+
+
+class ExportCache(object):
+    """
+    Directory of cached exports, bounded in size by evicting the least
+    recently used entries. Entries are written atomically, so a cache
+    directory can be shared by several processes.
+
+    :type directory: str
+    :param directory: Cache directory, created if needed
+
+    :type max_bytes: int
+    :param max_bytes: Maximum total size of the cached exports
+    """
+
+    def __init__(self, directory, max_bytes=1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.export')
+
+    def get(self, key):
+        """
+        Open a cached export, or return None if it is not cached. The
+        export stays readable through the returned file even if it is
+        evicted (by this or another process) in the meantime.
+
+        :rtype: file
+        :return: the cached export, opened in binary mode
+        """
+        path = self._path(key)
+        try:
+            handle = open(path, 'rb')
+        except (IOError, OSError):
+            return None
+        try:
+            # Mark as recently used
+            os.utime(path, None)
+        except OSError:
+            pass
+        return handle
+
+    def put(self, key, source):
+        """
+        Move a file into the cache, evicting old entries as needed. The new
+        entry itself is never evicted here, even if it is larger than
+        max_bytes on its own.
+
+        :rtype: file
+        :return: the cached export, opened in binary mode
+        """
+        path = self._path(key)
+        # Opened before the rename, so that a concurrent eviction cannot
+        # remove it from under us
+        handle = open(source, 'rb')
+        try:
+            os.rename(source, path)
+            self.evict(keep=key)
+        except Exception:
+            handle.close()
+            raise
+        return handle
+
+    def temporary_path(self):
+        """A path in the cache directory to write a new export to"""
+        handle, path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(handle)
+        return path
+
+    def _marker_path(self, key):
+        return os.path.join(self.directory, key + '.marker')
+
+    def get_marker(self, key, max_age):
+        """
+        Change marker stored by :meth:`put_marker`, or None if there is none
+        younger than ``max_age`` seconds
+
+        :rtype: str
+        :return: the change marker
+        """
+        path = self._marker_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) >= max_age:
+                return None
+            with open(path) as handle:
+                return json.load(handle)['marker']
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+    def put_marker(self, key, marker):
+        """Store a change marker, replacing the previous one atomically"""
+        temporary = self.temporary_path()
+        try:
+            with open(temporary, 'w') as handle:
+                json.dump({'marker': marker}, handle)
+            os.rename(temporary, self._marker_path(key))
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
 
+    def evict(self, keep=None):
+        """
+        Remove least recently used exports until the cache fits in max_bytes
 
-class IOClient(Client):
+        :type keep: str
+        :param keep: Key of an entry not to remove
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.export'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(x[1] for x in entries)
+        kept = None if keep is None else os.path.basename(self._path(keep))
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == kept:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+
+class IOMixin(object):
+    """
+    Requests of the Apollo IO module, shared by :class:`IOClient` and
+    :class:`apollo.aio.AsyncIOClient`
+    """
     CLIENT_BASE = '/IOService/'
+    IDEMPOTENT_METHODS = frozenset([
+        'download',
+        'write',
+    ])
 
     def write_downloadable(self, organism, export_type='FASTA',
                            seq_type='peptide', export_format='text',
@@ -37,7 +273,7 @@ class IOClient(Client):
 
         data = {
             'type': export_type,
-            'seq_type': seq_type,
+            'seqType': seq_type,
             'format': export_format,
             'sequences': sequences,
             'organism': organism,
@@ -75,10 +311,17 @@ class IOClient(Client):
         :rtype: str
         :return: the exported data
         """
+        data = self._text_export_data(organism, export_type, seq_type,
+                                      export_format, export_gff3_fasta,
+                                      sequences)
+        return self.post('write', data, is_json=False)
+
+    def _text_export_data(self, organism, export_type, seq_type,
+                          export_format, export_gff3_fasta, sequences):
         if sequences is None:
             sequences = []
 
-        data = {
+        return {
             'type': export_type,
             'seqType': seq_type,
             'format': export_format,
@@ -89,27 +332,465 @@ class IOClient(Client):
             'exportGff3Fasta': export_gff3_fasta,
         }
 
-        return self.post('write', data, is_json=False)
 
-    def download(self, uuid, output_format='gzip'):
+class IOClient(IOMixin, Client):
+
+    def write_text_cached(self, organism, cache_dir, export_type='FASTA',
+                          seq_type='peptide', export_gff3_fasta=False,
+                          sequences=[], max_cache_size=1024 ** 3, marker=None,
+                          marker_ttl=60):
+        """
+        Same as write_text, but served from an on-disk cache when the
+        organism's annotations did not change since the cached export
+
+        Without an explicit ``marker``, telling whether the annotations
+        changed means fetching every feature of the exported sequences,
+        which on a large organism costs about as much as the export itself.
+        The marker computed this way is cached for ``marker_ttl`` seconds,
+        so exports made in the meantime can miss the latest edits. Passing a
+        ``marker`` (e.g. a version number maintained by the caller) is the
+        fast path, no request being made when the export is cached.
+
+        :type organism: str
+        :param organism: organism common name
+
+        :type cache_dir: str
+        :param cache_dir: Cache directory
+
+        :type sequences: str
+        :param sequences: Names of references sequences to add (default is all)
+
+        :type export_type: str
+        :param export_type: Export type. Choices: FASTA, GFF3
+
+        :type seq_type: str
+        :param seq_type: Export selection. Choices: peptide, cds, cdna, genomic
+
+        :type export_gff3_fasta: bool
+        :param export_gff3_fasta: Export reference sequence when exporting GFF3 annotations.
+
+        :type max_cache_size: int
+        :param max_cache_size: Maximum size of the cache directory, in bytes
+
+        :type marker: str
+        :param marker: Value changing whenever the organism's annotations do.
+          By default, a digest of the identifier and modification time of
+          every feature of the exported sequences is fetched.
+
+        :type marker_ttl: float
+        :param marker_ttl: Number of seconds the default marker is reused
+          for, 0 to fetch it on every call
+
+        :rtype: str
+        :return: the exported data
+        """
+        cache = ExportCache(cache_dir, max_bytes=max_cache_size)
+        if marker is None:
+            marker_key = hashlib.sha256(json.dumps([
+                self._wa.apollo_url, organism, sorted(sequences or []),
+            ]).encode('utf-8')).hexdigest()
+            if marker_ttl > 0:
+                marker = cache.get_marker(marker_key, marker_ttl)
+            if marker is None:
+                marker = self._change_marker(organism, sequences)
+                if marker_ttl > 0:
+                    cache.put_marker(marker_key, marker)
+
+        key = hashlib.sha256(json.dumps([
+            organism, sorted(sequences or []), export_type, seq_type,
+            export_gff3_fasta, marker,
+        ]).encode('utf-8')).hexdigest()
+
+        handle = cache.get(key)
+        if handle is None:
+            temporary = cache.temporary_path()
+            try:
+                self.write_file(organism, temporary, export_type=export_type,
+                                seq_type=seq_type, export_format='text',
+                                export_gff3_fasta=export_gff3_fasta,
+                                sequences=sequences)
+                handle = cache.put(key, temporary)
+            finally:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+
+        with handle:
+            return handle.read().decode('utf-8')
+
+    def _change_marker(self, organism, sequences):
+        """Digest of the identity and modification time of every feature"""
+        digests = {}
+        features = self._wa.annotations.get_organism_features(
+            organism, sequences=sequences or None)
+        for sequence, response in features:
+            stamps = sorted(
+                '%s %s' % (feature['uniquename'], feature.get('date_last_modified'))
+                for feature in response.get('features', [])
+            )
+            digests[sequence] = hashlib.sha256('\n'.join(stamps).encode('utf-8')).hexdigest()
+
+        return hashlib.sha256(json.dumps(sorted(digests.items())).encode('utf-8')).hexdigest()
+
+    def write_file(self, organism, path, export_type='FASTA', seq_type='peptide',
+                   export_format='text', export_gff3_fasta=False,
+                   sequences=[], keep_compressed=False, chunk_size=65536):
+        """
+        Stream an export for an organism straight to a file, without
+        loading it in memory
+
+        :type organism: str
+        :param organism: organism common name
+
+        :type path: str
+        :param path: Path of the output file (or a file-like object opened in binary mode)
+
+        :type sequences: str
+        :param sequences: Names of references sequences to add (default is all)
+
+        :type export_type: str
+        :param export_type: Export type. Choices: FASTA, GFF3
+
+        :type seq_type: str
+        :param seq_type: Export selection. Choices: peptide, cds, cdna, genomic
+
+        :type export_format: str
+        :param export_format: Export format, either gzip or text
+
+        :type export_gff3_fasta: bool
+        :param export_gff3_fasta: Export reference sequence when exporting GFF3 annotations.
+
+        :type keep_compressed: bool
+        :param keep_compressed: Write gzip exports as sent by the server,
+          rather than decompressing them
+
+        :type chunk_size: int
+        :param chunk_size: Size of the chunks read from the server, in bytes
+
+        :rtype: int
+        :return: the number of bytes written
+        """
+        data = self._text_export_data(organism, export_type, seq_type,
+                                      export_format, export_gff3_fasta,
+                                      sequences)
+
+        decompressor = None
+        if not keep_compressed and export_format.lower() == 'gzip':
+            # Accept gzip headers
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        with closing(self.post_stream('write', data)) as resp:
+            if hasattr(path, 'write'):
+                return _write_chunks(resp, path, decompressor, chunk_size)
+            with open(path, 'wb') as handle:
+                return _write_chunks(resp, handle, decompressor, chunk_size)
+
+    def write_sharded(self, organism, path, export_type='GFF3', seq_type='genomic',
+                      export_format='text', export_gff3_fasta=False,
+                      sequences=None, shards=None, workers=4):
+        """
+        Export data for an organism as shards of its sequences exported
+        concurrently, then combined into a single file in sequence order
+
+        :type organism: str
+        :param organism: organism common name
+
+        :type path: str
+        :param path: Path of the output file (or a file-like object opened in binary mode)
+
+        :type export_type: str
+        :param export_type: Export type. Choices: FASTA, GFF3
+
+        :type seq_type: str
+        :param seq_type: Export selection. Choices: peptide, cds, cdna, genomic
+
+        :type export_format: str
+        :param export_format: Transfer format of each shard, either gzip or text.
+          The output file is always uncompressed.
+
+        :type export_gff3_fasta: bool
+        :param export_gff3_fasta: Export reference sequence when exporting GFF3 annotations.
+
+        :type sequences: list
+        :param sequences: Names of references sequences to export (default is all)
+
+        :type shards: int
+        :param shards: Number of shards (default: twice the number of workers)
+
+        :type workers: int
+        :param workers: Number of concurrent exports
+
+        :rtype: int
+        :return: the number of bytes written
         """
-        [CURRENTLY BROKEN] Download pre-prepared data by UUID
+        if not sequences:
+            sequences = self._wa.organisms._sequence_names(organism)
+        sequences = list(sequences)
+        if not sequences:
+            raise Exception("Organism %s has no sequences to export" % organism)
+        if shards is None:
+            shards = workers * 2
+        shards = max(1, min(shards, len(sequences)))
+
+        # Contiguous slices, so that concatenating them preserves the order
+        # of the sequences
+        size, extra = divmod(len(sequences), shards)
+        slices = []
+        start = 0
+        for i in range(shards):
+            end = start + size + (1 if i < extra else 0)
+            slices.append(sequences[start:end])
+            start = end
+
+        directory = tempfile.mkdtemp(prefix='apollo-export-')
+        try:
+            def export(i):
+                shard_path = os.path.join(directory, '%d' % i)
+                self.write_file(organism, shard_path, export_type=export_type,
+                                seq_type=seq_type, export_format=export_format,
+                                export_gff3_fasta=export_gff3_fasta,
+                                sequences=slices[i])
+                return shard_path
+
+            executor = ThreadPoolExecutor(max_workers=workers)
+            try:
+                shard_paths = list(executor.map(export, range(len(slices))))
+            finally:
+                executor.shutdown(wait=True)
+
+            if hasattr(path, 'write'):
+                return _merge_shards(shard_paths, path, export_type)
+            with open(path, 'wb') as handle:
+                return _merge_shards(shard_paths, handle, export_type)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def download(self, uuid, path, output_format='gzip', timeout=300,
+                 chunk_size=65536, restart=False, checksum=None,
+                 checksum_type='sha256', retries=3):
+        """
+        Download data prepared with write_downloadable, by UUID. The file is
+        polled for (with exponential backoff) until it is ready, then streamed
+        to disk.
+
+        When writing to a path, data is first written to ``<path>.part``,
+        alongside a ``<path>.part.json`` journal. If the transfer is
+        interrupted, it is resumed with an HTTP range request (when the
+        server supports them), both within this call (up to ``retries``
+        times) and by a later call for the same UUID and path. A ``.part``
+        file the server reports as already complete (416 response) is kept
+        if a checksum confirms it, and downloaded again otherwise.
 
         :type uuid: str
         :param uuid: Data UUID
 
+        :type path: str
+        :param path: Path of the output file (or a file-like object opened in
+          binary mode, which disables resuming)
+
         :type output_format: str
         :param output_format: Output format of the data, either "gzip" or "text"
 
-        :rtype: dict
-        :return: a dictionary
+        :type timeout: float
+        :param timeout: Maximum number of seconds to wait for the data to be ready
+
+        :type chunk_size: int
+        :param chunk_size: Size of the chunks read from the server, in bytes
+
+        :type restart: bool
+        :param restart: Start over rather than resume a previous, interrupted
+          download of this UUID to this path
+
+        :type checksum: str
+        :param checksum: Expected hex digest of the downloaded file. A
+          Content-MD5 header sent by the server is verified as well.
+
+        :type checksum_type: str
+        :param checksum_type: Hash algorithm of ``checksum``
+
+        :type retries: int
+        :param retries: Number of times an interrupted transfer is resumed
+
+        :rtype: int
+        :return: the number of bytes written
         """
 
         if output_format.lower() not in ('gzip', 'text'):
-            raise Exception("outputFormat must be one of file, text")
+            raise Exception("output_format must be one of gzip, text")
 
-        data = {
+        params = {
             'format': output_format,
             'uuid': uuid,
         }
-        return self.post('write', data)
+
+        if hasattr(path, 'write'):
+            with closing(self._wait_for_download(params, timeout)) as resp:
+                return _write_chunks(resp, path, None, chunk_size)
+
+        part = path + '.part'
+        journal_path = part + '.json'
+        journal = {}
+        if not restart and os.path.exists(part) and os.path.exists(journal_path):
+            with open(journal_path) as handle:
+                journal = json.load(handle)
+            if journal.get('uuid') != uuid or journal.get('format') != output_format:
+                journal = {}
+
+        content_md5 = journal.get('content_md5')
+
+        def verified():
+            try:
+                _verify_checksum(part, checksum_type, checksum)
+                if content_md5:
+                    _verify_checksum(part, 'md5', base64.b64decode(content_md5), digest=True)
+            except Exception:
+                return False
+            return True
+
+        attempt = 0
+        while True:
+            offset = os.path.getsize(part) if journal else 0
+            headers = {}
+            if offset:
+                headers['Range'] = 'bytes=%d-' % offset
+                if journal.get('validator'):
+                    # Only resume if the file did not change in the meantime
+                    headers['If-Range'] = journal['validator']
+
+            try:
+                with closing(self._wait_for_download(params, timeout, headers)) as resp:
+                    if resp.status_code != 206:
+                        # Whole file, either asked for or because the server
+                        # does not support (or rejected) the range
+                        offset = 0
+                        content_md5 = resp.headers.get('Content-MD5')
+                        journal = {
+                            'uuid': uuid,
+                            'format': output_format,
+                            'validator': resp.headers.get('ETag') or resp.headers.get('Last-Modified'),
+                            'content_md5': content_md5,
+                        }
+                        with open(journal_path, 'w') as handle:
+                            json.dump(journal, handle)
+
+                    with open(part, 'ab' if offset else 'wb') as handle:
+                        _write_chunks(resp, handle, None, chunk_size)
+                break
+            except UnexpectedResponseException as e:
+                if e.status_code != 416 or not offset:
+                    raise
+                # Range starting at the end of the file: the transfer was
+                # complete but not renamed. Keep it if a checksum confirms
+                # it, otherwise start over.
+                if (checksum or content_md5) and verified():
+                    break
+                journal = {}
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError):
+                attempt += 1
+                if attempt > retries:
+                    raise
+
+        try:
+            _verify_checksum(part, checksum_type, checksum)
+            if content_md5:
+                _verify_checksum(part, 'md5', base64.b64decode(content_md5), digest=True)
+        except Exception:
+            # Corrupt, start from scratch next time
+            os.remove(part)
+            os.remove(journal_path)
+            raise
+
+        size = os.path.getsize(part)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(part, path)
+        os.remove(journal_path)
+        return size
+
+    def _wait_for_download(self, params, timeout, headers=None):
+        deadline = time.time() + timeout
+        delay = 0.5
+        while True:
+            try:
+                return self.post_stream('download', {}, post_params=params, headers=headers)
+            except UnexpectedResponseException as e:
+                # Apollo answers 404 until the file is available
+                if e.status_code != 404 or time.time() + delay > deadline:
+                    raise
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def export(self, organism, path, export_type='FASTA', seq_type='peptide',
+               export_format='gzip', export_gff3_fasta=False, sequences=[],
+               timeout=300):
+        """
+        Prepare a download for an organism on the server, then download it
+
+        :type organism: str
+        :param organism: organism common name
+
+        :type path: str
+        :param path: Path of the output file (or a file-like object opened in binary mode)
+
+        :type sequences: str
+        :param sequences: Names of references sequences to add (default is all)
+
+        :type export_type: str
+        :param export_type: Export type. Choices: FASTA, GFF3
+
+        :type seq_type: str
+        :param seq_type: Export selection. Choices: peptide, cds, cdna, genomic
+
+        :type export_format: str
+        :param export_format: Export format, either gzip or text
+
+        :type export_gff3_fasta: bool
+        :param export_gff3_fasta: Export reference sequence when exporting GFF3 annotations.
+
+        :type timeout: float
+        :param timeout: Maximum number of seconds to wait for the data to be ready
+
+        :rtype: int
+        :return: the number of bytes written
+        """
+        prepared = self.write_downloadable(organism, export_type=export_type,
+                                           seq_type=seq_type,
+                                           export_format=export_format,
+                                           export_gff3_fasta=export_gff3_fasta,
+                                           sequences=sequences)
+        if 'uuid' not in prepared:
+            raise Exception("Apollo did not prepare the download: %s" % prepared)
+        return self.download(prepared['uuid'], path, output_format=export_format,
+                             timeout=timeout)
+
+    def export_many(self, exports, workers=4, timeout=300):
+        """
+        Run several exports concurrently, see :meth:`export`::
+
+            wa.io.export_many([
+                {'organism': 'Yeast', 'path': 'yeast.gff3.gz', 'export_type': 'GFF3'},
+                {'organism': 'Yeast', 'path': 'yeast.fa.gz', 'seq_type': 'cds'},
+            ])
+
+        :type exports: list of dict
+        :param exports: Keyword arguments of each export
+
+        :type workers: int
+        :param workers: Number of exports in flight at once
+
+        :type timeout: float
+        :param timeout: Maximum number of seconds to wait for each export
+
+        :rtype: list
+        :return: the number of bytes written by each export, in order
+        """
+        def run(kwargs):
+            kwargs = dict(kwargs)
+            kwargs.setdefault('timeout', timeout)
+            return self.export(**kwargs)
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            return list(executor.map(run, exports))
+        finally:
+            executor.shutdown(wait=True)
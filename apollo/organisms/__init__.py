@@ -6,6 +6,15 @@ from apollo.client import Client
 
 class OrganismsClient(Client):
     CLIENT_BASE = '/organism/'
+    READ_METHODS = frozenset([
+        'findAllOrganisms',
+        'getSequencesForOrganism',
+    ])
+    IDEMPOTENT_METHODS = READ_METHODS | frozenset([
+        'updateOrganismInfo',
+    ])
+    # Organism permissions are listed with users and groups
+    INVALIDATES = ('/user/', '/group/')
 
     def add_organism(self, common_name, directory, blatdb=None, genus=None,
                      species=None, public=False):
@@ -162,3 +171,11 @@ class OrganismsClient(Client):
         :return: The set of sequences associated with an organism
         """
         return self.post('getSequencesForOrganism', {'organism': organism_id})
+
+    def _sequence_names(self, organism):
+        """Names of the reference sequences of an organism (ID or common name)"""
+        response = self.get_sequences(organism)
+        # Depending on the Apollo version, the list may be wrapped in a dict
+        if isinstance(response, dict):
+            response = response.get('sequences', [])
+        return [x['name'] for x in response]
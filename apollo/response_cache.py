@@ -0,0 +1,258 @@
+"""
+Read-through cache of the responses of Apollo read endpoints
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds responses of these endpoints are cached for, by default
+DEFAULT_TTLS = {
+    '/organism/findAllOrganisms': 60,
+    '/organism/getSequencesForOrganism': 300,
+    '/user/loadUsers': 60,
+    '/group/loadGroups': 60,
+    '/availableStatus/showStatus': 300,
+    '/cannedComment/showComment': 300,
+    '/cannedKey/showKey': 300,
+    '/cannedValue/showValue': 300,
+}
+
+
+def _is_error(body):
+    """Whether a response body is an Apollo error, which Apollo sends with
+    a 200 status"""
+    try:
+        data = json.loads(body)
+    except (TypeError, ValueError):
+        return False
+    return isinstance(data, dict) and 'error' in data
+
+
+class MemoryBackend(object):
+    """
+    Cache entries kept in memory, evicting the least recently used
+
+    :type maxsize: int
+    :param maxsize: Maximum number of entries
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            # Most recently used last
+            del self._entries[key]
+            self._entries[key] = entry
+            return entry[2]
+
+    def set(self, key, scope, value, ttl):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (scope, time.time() + ttl, value)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, scope):
+        with self._lock:
+            for key in [k for k, v in self._entries.items() if v[0] == scope]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteBackend(object):
+    """
+    Cache entries kept in an SQLite database, which several processes (for
+    instance workers of a pipeline, or arrow calls) may share. Entries are
+    evicted least recently used first.
+
+    :type path: str
+    :param path: Path of the database, created if needed
+
+    :type max_entries: int
+    :param max_entries: Maximum number of entries
+    """
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._db() as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, scope TEXT NOT NULL, expires REAL NOT NULL, '
+                'accessed REAL NOT NULL, value TEXT NOT NULL)')
+            db.execute('CREATE INDEX IF NOT EXISTS responses_scope ON responses (scope)')
+            db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+
+    def _db(self):
+        # sqlite3 connections may not be shared between threads
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30)
+        return db
+
+    def get(self, key):
+        now = time.time()
+        with self._db() as db:
+            row = db.execute('SELECT expires, value FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[0] <= now:
+                db.execute('DELETE FROM responses WHERE key = ?', (key,))
+                return None
+            db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            return row[1]
+
+    def set(self, key, scope, value, ttl):
+        now = time.time()
+        with self._db() as db:
+            db.execute(
+                'INSERT OR REPLACE INTO responses (key, scope, expires, accessed, value) '
+                'VALUES (?, ?, ?, ?, ?)', (key, scope, now + ttl, now, value))
+            count = db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            if count > self.max_entries:
+                db.execute('DELETE FROM responses WHERE expires <= ?', (now,))
+                db.execute(
+                    'DELETE FROM responses WHERE key IN ('
+                    'SELECT key FROM responses ORDER BY accessed LIMIT ?)',
+                    (max(0, count - self.max_entries),))
+
+    def invalidate(self, scope):
+        with self._db() as db:
+            db.execute('DELETE FROM responses WHERE scope = ?', (scope,))
+
+    def clear(self):
+        with self._db() as db:
+            db.execute('DELETE FROM responses')
+
+
+class ResponseCache(object):
+    """
+    Read-through cache of the responses of read endpoints, shared by every
+    client of an ApolloInstance. Responses are cached per user and request
+    payload, for a time depending on the endpoint, and a write sent through
+    the same instance drops the cached responses of its module (and of
+    related modules, e.g. groups and users).
+
+    Changes made by other Apollo users are only seen once the cached
+    response expires, so keep TTLs short for data edited elsewhere.
+
+    :type backend: object
+    :param backend: Where entries are stored, a :class:`MemoryBackend` by
+      default, or an :class:`SQLiteBackend` to share them between processes
+
+    :type ttls: dict
+    :param ttls: Seconds responses are cached for, by endpoint (e.g.
+      ``/organism/findAllOrganisms``), replacing :data:`DEFAULT_TTLS`
+
+    :type default_ttl: float
+    :param default_ttl: Seconds to cache the responses of the other read
+      endpoints for (default: not cached)
+    """
+
+    def __init__(self, backend=None, ttls=None, default_ttl=None):
+        self.backend = MemoryBackend() if backend is None else backend
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        # Incremented on every invalidation of a scope, so that a response
+        # fetched while a write was being sent is not stored
+        self._generations = {}
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'invalidations': 0,
+        }
+
+    def ttl(self, endpoint):
+        """Seconds the responses of an endpoint are cached for (None if not cached)"""
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def fetch(self, wa, base, client_method, payload, fn):
+        """
+        Cached response body of a request, or the body returned by ``fn``
+
+        :type wa: ApolloInstance
+        :param wa: Instance sending the request
+
+        :type base: str
+        :param base: ``CLIENT_BASE`` of the client
+
+        :type client_method: str
+        :param client_method: Endpoint
+
+        :type payload: str
+        :param payload: Serialised request parameters
+
+        :type fn: callable
+        :param fn: Sends the request and returns the response body
+
+        :rtype: str
+        :return: the response body (error bodies are returned but not cached)
+        """
+        endpoint = base + client_method
+        ttl = self.ttl(endpoint)
+        if not ttl:
+            return fn()
+
+        scope = wa.apollo_url + base
+        key = hashlib.sha1(json.dumps(
+            [wa.apollo_url, wa.username, endpoint, payload]).encode('utf-8')).hexdigest()
+        value = self.backend.get(key)
+        with self._lock:
+            self._counters['hits' if value is not None else 'misses'] += 1
+            generation = self._generations.get(scope, 0)
+        if value is not None:
+            return value
+
+        value = fn()
+        if _is_error(value):
+            return value
+        with self._lock:
+            current = self._generations.get(scope, 0) == generation
+        if current:
+            self.backend.set(key, scope, value, ttl)
+        return value
+
+    def invalidate(self, wa, bases):
+        """
+        Drop the cached responses of modules of an Apollo server
+
+        :type bases: list
+        :param bases: ``CLIENT_BASE`` of the modules
+        """
+        for base in bases:
+            scope = wa.apollo_url + base
+            with self._lock:
+                self._generations[scope] = self._generations.get(scope, 0) + 1
+                self._counters['invalidations'] += 1
+            self.backend.invalidate(scope)
+
+    def clear(self):
+        """Drop every cached response"""
+        self.backend.clear()
+
+    def stats(self):
+        """
+        Cache counters, for monitoring
+
+        :rtype: dict
+        :return: number of cache ``hits``, ``misses`` and ``invalidations``
+        """
+        with self._lock:
+            return dict(self._counters)
@@ -6,6 +6,12 @@ from apollo.client import Client
 
 class StatusClient(Client):
     CLIENT_BASE = '/availableStatus/'
+    READ_METHODS = frozenset([
+        'showStatus',
+    ])
+    IDEMPOTENT_METHODS = READ_METHODS | frozenset([
+        'updateStatus',
+    ])
 
     def add_status(self, status):
         """
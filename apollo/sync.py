@@ -0,0 +1,197 @@
+"""
+Incremental mirroring of Apollo annotations into a local SQLite snapshot
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from collections import namedtuple
+
+ADDED = 'added'
+MODIFIED = 'modified'
+DELETED = 'deleted'
+
+Change = namedtuple('Change', ['kind', 'organism', 'sequence', 'uniquename', 'feature'])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS features (
+    organism TEXT NOT NULL,
+    sequence TEXT NOT NULL,
+    uniquename TEXT NOT NULL,
+    date_last_modified INTEGER,
+    checksum TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (organism, uniquename)
+);
+CREATE INDEX IF NOT EXISTS features_sequence ON features (organism, sequence);
+CREATE TABLE IF NOT EXISTS sequences (
+    organism TEXT NOT NULL,
+    sequence TEXT NOT NULL,
+    last_synced REAL NOT NULL,
+    PRIMARY KEY (organism, sequence)
+);
+"""
+
+
+def _checksum(data):
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class AnnotationSync(object):
+    """
+    Keep a local snapshot of the features of Apollo organisms, keyed by
+    ``uniquename``, and report what changed since the previous sync::
+
+        with AnnotationSync(wa, 'apollo.sqlite') as mirror:
+            for change in mirror.sync('Yeast'):
+                print(change.kind, change.uniquename)
+
+    Apollo has no "changed since" query, so every synced sequence is still
+    fetched (concurrently, see
+    :meth:`apollo.annotations.AnnotationsClient.get_organism_features`), but
+    only the features which changed are written and reported.
+
+    :type wa: ApolloInstance
+    :param wa: Apollo instance to mirror
+
+    :type path: str
+    :param path: Path of the SQLite snapshot, created if needed
+    """
+
+    def __init__(self, wa, path):
+        self._wa = wa
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the snapshot database"""
+        self._db.close()
+
+    def sync(self, organism, sequences=None, workers=4, progress=None):
+        """
+        Fetch the organism's features and update the snapshot, yielding
+        every change. The changes of a sequence are committed once they have
+        all been consumed, so an interrupted sync reports them again next time.
+
+        :type organism: str
+        :param organism: Organism Common Name
+
+        :type sequences: list
+        :param sequences: Names of the sequences to sync (default is all; in
+          that case features of sequences the organism no longer has are
+          reported as deleted)
+
+        :type workers: int
+        :param workers: Number of concurrent requests
+
+        :type progress: callable
+        :param progress: Called as ``progress(done, total, sequence)`` after
+          each sequence is fetched
+
+        :rtype: generator
+        :return: :class:`Change` tuples, of kind ``added``, ``modified`` or ``deleted``
+        """
+        full = sequences is None
+        if full:
+            sequences = self._wa.organisms._sequence_names(organism)
+
+        fetched = self._wa.annotations.get_organism_features(
+            organism, sequences=sequences, workers=workers, progress=progress)
+        for sequence, response in fetched:
+            for change in self._sync_sequence(organism, sequence, response.get('features', [])):
+                yield change
+
+        if full:
+            known = set(sequences)
+            stale = [
+                row[0] for row in self._db.execute(
+                    'SELECT DISTINCT sequence FROM features WHERE organism = ?', (organism,))
+                if row[0] not in known
+            ]
+            for sequence in stale:
+                for change in self._sync_sequence(organism, sequence, []):
+                    yield change
+
+    def _sync_sequence(self, organism, sequence, features):
+        stored = dict(
+            (row[0], row[1]) for row in self._db.execute(
+                'SELECT uniquename, checksum FROM features WHERE organism = ? AND sequence = ?',
+                (organism, sequence))
+        )
+
+        changes = []
+        upserts = []
+        for feature in features:
+            uniquename = feature['uniquename']
+            data = json.dumps(feature, sort_keys=True)
+            checksum = _checksum(data)
+            previous = stored.pop(uniquename, None)
+            if previous == checksum:
+                continue
+
+            kind = ADDED if previous is None else MODIFIED
+            changes.append(Change(kind, organism, sequence, uniquename, feature))
+            upserts.append((organism, sequence, uniquename,
+                            feature.get('date_last_modified'), checksum, data))
+
+        deleted = list(stored.keys())
+        for uniquename in deleted:
+            changes.append(Change(DELETED, organism, sequence, uniquename, None))
+
+        for change in changes:
+            yield change
+
+        with self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO features '
+                '(organism, sequence, uniquename, date_last_modified, checksum, data) '
+                'VALUES (?, ?, ?, ?, ?, ?)', upserts)
+            self._db.executemany(
+                'DELETE FROM features WHERE organism = ? AND uniquename = ?',
+                [(organism, uniquename) for uniquename in deleted])
+            self._db.execute(
+                'INSERT OR REPLACE INTO sequences (organism, sequence, last_synced) '
+                'VALUES (?, ?, ?)', (organism, sequence, time.time()))
+
+    def features(self, organism, sequence=None):
+        """
+        Features stored in the snapshot
+
+        :type organism: str
+        :param organism: Organism Common Name
+
+        :type sequence: str
+        :param sequence: Only return the features of this sequence
+
+        :rtype: generator
+        :return: Apollo feature dictionaries
+        """
+        if sequence is None:
+            rows = self._db.execute(
+                'SELECT data FROM features WHERE organism = ? ORDER BY sequence, uniquename',
+                (organism,))
+        else:
+            rows = self._db.execute(
+                'SELECT data FROM features WHERE organism = ? AND sequence = ? ORDER BY uniquename',
+                (organism, sequence))
+        for row in rows:
+            yield json.loads(row[0])
+
+    def last_synced(self, organism, sequence):
+        """
+        Time of the last sync of a sequence
+
+        :rtype: float
+        :return: a UNIX timestamp, or None if the sequence was never synced
+        """
+        row = self._db.execute(
+            'SELECT last_synced FROM sequences WHERE organism = ? AND sequence = ?',
+            (organism, sequence)).fetchone()
+        return row[0] if row else None
@@ -36,6 +36,15 @@ def _fix_user(user):
 
 class UsersClient(Client):
     CLIENT_BASE = '/user/'
+    READ_METHODS = frozenset([
+        'loadUsers',
+    ])
+    IDEMPOTENT_METHODS = READ_METHODS | frozenset([
+        'updateOrganismPermission',
+        'updateUser',
+    ])
+    # Group membership and permissions are part of both users and groups
+    INVALIDATES = ('/group/',)
 
     def _handle_empty(self, user, response):
         """Apollo likes to return empty user arrays, even when you REALLY
@@ -1,6 +1,7 @@
 import argparse
 import json
-from Bio import SeqIO
+import mmap
+import os
 from apollo.exceptions import UnknownUserException
 
 
@@ -45,8 +46,7 @@ def GuessCn(args, wa):
     seqs = []
     if args.seq_fasta:
         # If we have a fasta, pull all rec ids from that.
-        for rec in SeqIO.parse(args.seq_fasta, 'fasta'):
-            seqs.append(rec.id)
+        seqs = fastaIds(args.seq_fasta)
     elif args.seq_raw:
         # Otherwise raw list.
         seqs = [x.strip() for x in args.seq_raw if len(x.strip()) > 0]
@@ -54,6 +54,79 @@ def GuessCn(args, wa):
     return org, seqs
 
 
+def _faiIds(path):
+    """IDs listed in a samtools ``.fai`` index, or None if there is no
+    index at least as recent as the fasta file"""
+    fai = path + '.fai'
+    try:
+        if os.path.getmtime(fai) < os.path.getmtime(path):
+            return None
+        with open(fai, 'rb') as handle:
+            return [line.split(b'\t', 1)[0].decode('utf-8')
+                    for line in handle if line.strip()]
+    except (IOError, OSError):
+        return None
+
+
+def _headerId(header):
+    # Same as Biopython's record id: the title up to the first whitespace
+    parts = header.split(None, 1)
+    return parts[0].decode('utf-8') if parts else ''
+
+
+def _mmapIds(path):
+    """IDs of a fasta file, reading only its header lines"""
+    ids = []
+    with open(path, 'rb') as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            return ids
+        data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            pos = 0 if data[:1] == b'>' else data.find(b'\n>')
+            if pos > 0:
+                pos += 1
+            while pos >= 0:
+                eol = data.find(b'\n', pos)
+                ids.append(_headerId(data[pos + 1:eol if eol >= 0 else len(data)]))
+                if eol < 0:
+                    break
+                pos = data.find(b'\n>', eol)
+                if pos >= 0:
+                    pos += 1
+        finally:
+            data.close()
+    return ids
+
+
+def fastaIds(fasta):
+    """
+    IDs of the sequences of a fasta file, without parsing the sequences.
+    A samtools ``.fai`` index next to the file is used when it is up to
+    date, otherwise only the header lines are read.
+
+    :type fasta: str
+    :param fasta: Path of the fasta file, or an open file (e.g. stdin)
+
+    :rtype: list
+    :return: the sequence IDs, in file order
+    """
+    path = fasta if isinstance(fasta, str) else getattr(fasta, 'name', None)
+    if isinstance(path, str) and os.path.isfile(path):
+        ids = _faiIds(path)
+        if ids is None:
+            ids = _mmapIds(path)
+        return ids
+
+    # Not a regular file, scan the stream line by line
+    ids = []
+    for line in fasta:
+        if line[:1] in ('>', b'>'):
+            if not isinstance(line, bytes):
+                line = line.encode('utf-8')
+            ids.append(_headerId(line[1:]))
+    return ids
+
+
 def AssertUser(user_list):
     if len(user_list) == 0:
         raise UnknownUserException()
@@ -70,43 +143,72 @@ def AssertAdmin(user):
         raise Exception("User is not an administrator. Permission denied")
 
 
+_APOLLO_TYPES = frozenset(('gene', 'mRNA', 'exon', 'CDS', 'terminator', 'tRNA'))
+_NAMED_TYPES = frozenset(('gene', 'mRNA'))
+
+
 def _tnType(feature):
-    if feature.type in ('gene', 'mRNA', 'exon', 'CDS', 'terminator', 'tRNA'):
+    if feature.type in _APOLLO_TYPES:
         return feature.type
     else:
         return 'exon'
 
 
-def _yieldFeatData(features):
-    for f in features:
-        current = {
-            'location': {
-                'strand': f.strand,
-                'fmin': int(f.location.start),
-                'fmax': int(f.location.end),
-            },
-            'type': {
-                'name': _tnType(f),
-                'cv': {
-                    'name': 'sequence',
-                }
-            },
-        }
-        if f.type in ('gene', 'mRNA'):
-            current['name'] = f.qualifiers.get('Name', [f.id])[0]
-        if hasattr(f, 'sub_features') and len(f.sub_features) > 0:
-            current['children'] = [x for x in _yieldFeatData(f.sub_features)]
-
-        yield current
+def _featData(f):
+    location = f.location
+    ftype = f.type
+    current = {
+        'location': {
+            'strand': location.strand,
+            'fmin': int(location.start),
+            'fmax': int(location.end),
+        },
+        'type': {
+            'name': _tnType(f),
+            'cv': {
+                'name': 'sequence',
+            }
+        },
+    }
+    if ftype in _NAMED_TYPES:
+        current['name'] = f.qualifiers.get('Name', [f.id])[0]
+    return current
 
 
-def featuresToFeatureSchema(features):
-    compiled = []
+def _yieldFeatData(features):
+    """
+    Convert features and their sub features, walking the feature tree with
+    an explicit stack rather than one generator per level
+    """
     for feature in features:
-        # if feature.type != 'gene':
-            # log.warn("Not able to handle %s features just yet...", feature.type)
-            # continue
+        top = _featData(feature)
+        stack = [(feature, top)]
+        while stack:
+            f, current = stack.pop()
+            sub_features = getattr(f, 'sub_features', None)
+            if sub_features:
+                children = []
+                for sub in sub_features:
+                    child = _featData(sub)
+                    children.append(child)
+                    stack.append((sub, child))
+                current['children'] = children
+        yield top
+
+
+def iterFeaturesToFeatureSchema(features):
+    """
+    Convert Biopython features to Apollo features one at a time, see
+    :func:`featuresToFeatureSchema`
+
+    :type features: iterable
+    :param features: Biopython SeqFeature objects (sub features become children)
+
+    :rtype: generator
+    :return: Apollo feature dictionaries
+    """
+    return _yieldFeatData(features)
 
-        for x in _yieldFeatData([feature]):
-            compiled.append(x)
-    return compiled
+
+def featuresToFeatureSchema(features):
+    return list(_yieldFeatData(features))
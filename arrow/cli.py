@@ -3,10 +3,10 @@ import os
 import sys
 import click
 import json
+import re
 
 from .io import error
 from .config import read_global_config, global_config_path  # noqa, ditto
-from .apollo import get_apollo_instance
 from arrow import __version__  # noqa, ditto
 
 CONTEXT_SETTINGS = dict(auto_envvar_prefix='ARROW', help_option_names=['-h', '--help'])
@@ -18,6 +18,29 @@ class Context(object):
         self.verbose = False
         self.home = os.getcwd()
         self._global_config = None
+        self.apollo_instance = None
+        self.output_format = 'pretty'
+        self._gi = None
+
+    @property
+    def gi(self):
+        # Connecting needs the apollo library (and requests), which are only
+        # imported once a command actually uses the instance.
+        if self._gi is None:
+            try:
+                self._gi = self._connect(self.apollo_instance)
+            except TypeError:
+                # Unconfigured, see `arrow init`
+                raise AttributeError("Could not access the Apollo instance configuration")
+        return self._gi
+
+    def _connect(self, instance_name):
+        from .apollo import get_apollo_instance
+        return get_apollo_instance(instance_name)
+
+    @gi.setter
+    def gi(self, value):
+        self._gi = value
 
     @property
     def global_config(self):
@@ -66,6 +89,26 @@ def list_subcmds(parent):
     return rv
 
 
+_GROUP_IMPORT = r'^from arrow\.commands\.%s\.(\w+) import cli as \w+$'
+_group_subcmds = {}
+
+
+def group_subcmds(group):
+    """
+    Commands of a generated group, read from the imports of its
+    ``cmd_<group>`` module rather than by importing it (and so every
+    command of the group). Empty for the commands which are not groups.
+    """
+    if group not in _group_subcmds:
+        try:
+            with open(os.path.join(cmd_folder, 'cmd_%s.py' % group)) as handle:
+                source = handle.read()
+        except (IOError, OSError):
+            source = ''
+        _group_subcmds[group] = re.findall(_GROUP_IMPORT % re.escape(group), source, re.M)
+    return _group_subcmds[group]
+
+
 def name_to_command(parent, name):
     try:
         if sys.version_info[0] == 2:
@@ -84,6 +127,37 @@ def name_to_command(parent, name):
     return mod.cli
 
 
+class LazyGroup(click.MultiCommand):
+    """
+    Group of the commands of an ``arrow.commands`` package, importing a
+    command only when it is invoked rather than all of them up front. Used
+    in place of the ``cli`` group of the generated ``cmd_<group>`` modules,
+    which imports every command of the group.
+
+    :type package: str
+    :param package: Name of the package holding the command modules
+
+    :type subcommands: list
+    :param subcommands: Names of the commands, see :func:`group_subcmds`
+    """
+
+    def __init__(self, name=None, package=None, subcommands=(), **attrs):
+        super(LazyGroup, self).__init__(name=name, **attrs)
+        self.package = package
+        self.subcommands = list(subcommands)
+        self._loaded = {}
+
+    def list_commands(self, ctx):
+        return self.subcommands
+
+    def get_command(self, ctx, name):
+        if name not in self.subcommands:
+            return None
+        if name not in self._loaded:
+            self._loaded[name] = name_to_command(self.package, name)
+        return self._loaded[name]
+
+
 class ArrowCLI(click.MultiCommand):
 
     def list_commands(self, ctx):
@@ -93,9 +167,11 @@ class ArrowCLI(click.MultiCommand):
         commands = [
             'init',
             'annotations',
+            'batch',
             'cannedcomments',
             'cannedkeys',
             'cannedvalues',
+            'daemon',
             'groups',
             'io',
             'metrics',
@@ -106,6 +182,9 @@ class ArrowCLI(click.MultiCommand):
         return commands
 
     def get_command(self, ctx, name):
+        subcommands = group_subcmds(name)
+        if subcommands:
+            return LazyGroup(name=name, package=name, subcommands=subcommands)
         return name_to_command(None, name)
 
 
@@ -121,18 +200,24 @@ class ArrowCLI(click.MultiCommand):
     show_default=True,
     required=True
 )
+@click.option(
+    "-o",
+    "--output",
+    help='JSON output: indented, compact (single line) or ndjson (one compact '
+         'line per element of lists, or per feature of feature dictionaries, '
+         'written as they are encoded)',
+    type=click.Choice(['pretty', 'compact', 'ndjson']),
+    default='pretty',
+    show_default=True
+)
 @pass_context
-def arrow(ctx, apollo_instance, verbose):
+def arrow(ctx, apollo_instance, verbose, output):
     """Command line wrappers around Apollo functions. While this sounds
     unexciting, with arrow and jq you can easily build powerful command line
     scripts."""
-    # We abuse this, knowing that calls to one will fail.
-    try:
-        ctx.gi = get_apollo_instance(apollo_instance)
-    except TypeError:
-        pass
-        # ctx.log("Could not access Galaxy instance configuration")
-
+    # Connected on first use of ctx.gi
+    ctx.apollo_instance = apollo_instance
+    ctx.output_format = output
     ctx.verbose = verbose
 
 
@@ -148,3 +233,19 @@ def json_loads(data):
             return json.load(handle)
     else:
         return json.loads(data)
+
+
+def main():
+    """
+    Entry point of the ``arrow`` script: run the command in a running
+    ``arrow daemon`` if there is one, otherwise in this process.
+    """
+    argv = sys.argv[1:]
+    if not os.environ.get('ARROW_NO_DAEMON'):
+        from .daemon import forward, socket_path
+        path = socket_path()
+        if os.path.exists(path):
+            exit_code = forward(argv, path)
+            if exit_code is not None:
+                sys.exit(exit_code)
+    arrow(args=argv, prog_name='arrow')
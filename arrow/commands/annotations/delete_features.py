@@ -0,0 +1,34 @@
+import click
+from arrow.cli import pass_context
+from arrow.decorators import custom_exception, dict_output
+
+
+@click.command('delete_features')
+@click.argument("feature_ids", type=str, nargs=-1)
+@click.option(
+    "--organism",
+    help="Organism Common Name",
+    type=str
+)
+@click.option(
+    "--sequence",
+    help="Sequence Name",
+    type=str
+)
+@click.option(
+    "--batch_size",
+    help="Maximum number of features per request (default: BATCH_SIZE)",
+    type=int
+)
+@pass_context
+@custom_exception
+@dict_output
+def cli(ctx, feature_ids, organism="", sequence="", batch_size=""):
+    """Delete many features, using as few requests as possible
+
+Output:
+
+    A standard apollo feature dictionary ({"features": [{...}]})
+      containing the results of every batch
+    """
+    return ctx.gi.annotations.delete_features(feature_ids, organism=organism, sequence=sequence, batch_size=batch_size)
@@ -0,0 +1,33 @@
+import click
+from arrow.cli import pass_context
+from arrow.decorators import custom_exception, dict_output
+
+
+@click.command('load_gff3')
+@click.argument("organism", type=str)
+@click.argument("gff3", type=str)
+@click.option(
+    "--batch_size",
+    help="Maximum number of features per request (default: BATCH_SIZE)",
+    type=int
+)
+@click.option(
+    "--workers",
+    help="Number of sequences loaded concurrently",
+    default="4",
+    show_default=True,
+    type=int
+)
+@pass_context
+@custom_exception
+@dict_output
+def cli(ctx, organism, gff3, batch_size=None, workers=4):
+    """Load the features of a GFF3 file.
+
+Output:
+
+    a summary of the load: number of features ``loaded``, list
+      of ``failures`` (sequence, feature names, error), ``elapsed``
+      seconds and ``features_per_second``
+    """
+    return ctx.gi.annotations.load_gff3(organism, gff3, batch_size=batch_size, workers=workers)
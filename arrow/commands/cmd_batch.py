@@ -0,0 +1,122 @@
+import json
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from arrow.cli import group_subcmds, pass_context
+from arrow.io import error
+
+
+def _resolve(gi, command):
+    """Client method behind an arrow command, e.g. ``annotations set_name``"""
+    if isinstance(command, (list, tuple)):
+        parts = list(command)
+    else:
+        parts = str(command).split()
+    if len(parts) != 2:
+        raise Exception("Expected a command of the form '<group> <command>', got %r" % (command,))
+
+    group, name = parts
+    if not group_subcmds(group):
+        raise Exception("Unknown command group %s" % group)
+    if name not in group_subcmds(group):
+        raise Exception("Unknown command %s %s" % (group, name))
+    return getattr(getattr(gi, group), name)
+
+
+def _execute(gi, index, line):
+    result = {'line': index}
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict) or 'command' not in request:
+            raise Exception("Expected an object with a 'command' key")
+        if 'id' in request:
+            result['id'] = request['id']
+        result['command'] = request['command']
+
+        args = request.get('args', [])
+        kwargs = request.get('kwargs', {})
+        if isinstance(args, dict):
+            args, kwargs = [], dict(kwargs, **args)
+
+        method = _resolve(gi, request['command'])
+        result['result'] = method(*args, **kwargs)
+        result['ok'] = True
+    except Exception as e:
+        result['ok'] = False
+        result['error'] = str(e)
+        if hasattr(e, 'status_code'):
+            result['status_code'] = e.status_code
+    return result
+
+
+@click.command('batch')
+@click.argument("requests", type=click.File('r'), default='-')
+@click.option(
+    "--workers",
+    help="Number of requests executed concurrently",
+    default="1",
+    show_default=True,
+    type=int
+)
+@click.option(
+    "--fail_fast",
+    help="Stop at the first failing request",
+    is_flag=True
+)
+@pass_context
+def cli(ctx, requests, workers=1, fail_fast=False):
+    """Run many commands over a single connection pool.
+
+Reads JSON-lines requests, such as
+``{"command": "annotations set_name", "args": {"feature_id": "...", "name": "..."}}``
+(``args`` being a list of positional arguments or an object of named ones,
+and ``id`` an optional value echoed in the result), from a file or stdin.
+
+Output:
+
+    One JSON line per request, in input order, with ``ok`` and either
+    the command's ``result`` or an ``error``
+    """
+    if workers < 1:
+        raise click.BadParameter("workers must be a positive integer")
+
+    # Connect once, all of the requests share the instance's connection pool
+    gi = ctx.gi
+    failed = []
+    executor = ThreadPoolExecutor(max_workers=workers)
+    # Requests are read as the window drains, so large inputs are streamed,
+    # and results are written in input order.
+    pending = deque()
+
+    def drain(keep):
+        while len(pending) > keep:
+            result = pending.popleft().result()
+            click.echo(json.dumps(result, default=str))
+            if not result['ok']:
+                failed.append(result['line'])
+                if fail_fast:
+                    return
+
+    try:
+        for index, line in enumerate(requests, start=1):
+            if not line.strip():
+                continue
+            pending.append(executor.submit(_execute, gi, index, line))
+            drain(workers * 2 - 1)
+            if failed and fail_fast:
+                break
+        else:
+            drain(0)
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        sys.stdout.flush()
+
+    if failed:
+        if fail_fast:
+            error("Batch stopped at the failing request on line %d" % failed[0])
+        ctx.exit(1)
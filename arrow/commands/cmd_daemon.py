@@ -0,0 +1,104 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import click
+
+from arrow.cli import pass_context
+from arrow.daemon import ArrowDaemon, request, socket_path
+from arrow.io import error, info
+
+socket_option = click.option(
+    "--socket",
+    help="Path of the daemon's socket (default: $ARROW_DAEMON_SOCKET or ~/.apollo-arrow.sock)",
+    type=str
+)
+
+
+@click.group()
+def cli():
+    """Resident arrow process, running the commands of the arrow script
+    without starting Python or connecting to Apollo every time.
+    Set ARROW_NO_DAEMON to run a command in process anyway."""
+    pass
+
+
+@cli.command('start')
+@socket_option
+@click.option(
+    "--foreground",
+    help="Serve in this process rather than in the background",
+    is_flag=True
+)
+@click.option(
+    "--timeout",
+    help="Seconds to wait for a background daemon to start",
+    default="10",
+    show_default=True,
+    type=float
+)
+@pass_context
+def start(ctx, socket=None, foreground=False, timeout=10):
+    """Start the arrow daemon
+    """
+    path = socket or socket_path()
+    if request(path, {'op': 'status'}) is not None:
+        info("The arrow daemon is already running on %s" % path)
+        return
+
+    if foreground:
+        ArrowDaemon(path).serve()
+        return
+
+    with open(os.devnull, 'r+') as devnull:
+        # setsid detaches the daemon from this terminal's session
+        proc = subprocess.Popen([sys.executable, '-m', 'arrow.daemon', path],
+                                stdin=devnull, stdout=devnull, stderr=devnull,
+                                preexec_fn=os.setsid, close_fds=True)
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = request(path, {'op': 'status'})
+        if status is not None:
+            info("Started the arrow daemon (pid %d) on %s" % (status['pid'], path))
+            return
+        if proc.poll() is not None:
+            break
+        time.sleep(0.05)
+    error("The arrow daemon failed to start, try `arrow daemon start --foreground`")
+    ctx.exit(1)
+
+
+@cli.command('stop')
+@socket_option
+@pass_context
+def stop(ctx, socket=None):
+    """Stop the arrow daemon
+    """
+    path = socket or socket_path()
+    response = request(path, {'op': 'stop'})
+    if response is None:
+        error("The arrow daemon is not running")
+        ctx.exit(1)
+    info("Stopped the arrow daemon (pid %d)" % response['pid'])
+
+
+@cli.command('status')
+@socket_option
+@pass_context
+def status(ctx, socket=None):
+    """Show the state of the arrow daemon
+
+Output:
+
+    pid, socket path, start time, number of requests and loaded
+    Apollo instances of the daemon
+    """
+    path = socket or socket_path()
+    response = request(path, {'op': 'status'})
+    if response is None:
+        error("The arrow daemon is not running")
+        ctx.exit(1)
+    print(json.dumps(response, indent=4))
@@ -1,7 +1,11 @@
 import click
 from arrow.commands.io.download import cli as func0
-from arrow.commands.io.write_downloadable import cli as func1
-from arrow.commands.io.write_text import cli as func2
+from arrow.commands.io.export import cli as func1
+from arrow.commands.io.write_downloadable import cli as func2
+from arrow.commands.io.write_file import cli as func3
+from arrow.commands.io.write_sharded import cli as func4
+from arrow.commands.io.write_text import cli as func5
+from arrow.commands.io.write_text_cached import cli as func6
 
 
 @click.group()
@@ -12,3 +16,7 @@ def cli():
 cli.add_command(func0)
 cli.add_command(func1)
 cli.add_command(func2)
+cli.add_command(func3)
+cli.add_command(func4)
+cli.add_command(func5)
+cli.add_command(func6)
@@ -1,10 +1,11 @@
 import click
 from arrow.cli import pass_context
-from arrow.decorators import custom_exception, dict_output
+from arrow.decorators import custom_exception, str_output
 
 
 @click.command('download')
 @click.argument("uuid", type=str)
+@click.argument("path", type=str)
 @click.option(
     "--output_format",
     help="Output format of the data, either \"gzip\" or \"text\"",
@@ -12,14 +13,54 @@ from arrow.decorators import custom_exception, dict_output
     show_default=True,
     type=str
 )
+@click.option(
+    "--timeout",
+    help="Maximum number of seconds to wait for the data to be ready",
+    default="300",
+    show_default=True,
+    type=float
+)
+@click.option(
+    "--chunk_size",
+    help="Size of the chunks read from the server, in bytes",
+    default="65536",
+    show_default=True,
+    type=int
+)
+@click.option(
+    "--restart",
+    help="Start over rather than resume a previous, interrupted download of this UUID to this path",
+    is_flag=True
+)
+@click.option(
+    "--checksum",
+    help="Expected hex digest of the downloaded file. A Content-MD5 header sent by the server is verified as well.",
+    type=str
+)
+@click.option(
+    "--checksum_type",
+    help="Hash algorithm of ``checksum``",
+    default="sha256",
+    show_default=True,
+    type=str
+)
+@click.option(
+    "--retries",
+    help="Number of times an interrupted transfer is resumed",
+    default="3",
+    show_default=True,
+    type=int
+)
 @pass_context
 @custom_exception
-@dict_output
-def cli(ctx, uuid, output_format="gzip"):
-    """[CURRENTLY BROKEN] Download pre-prepared data by UUID
+@str_output
+def cli(ctx, uuid, path, output_format="gzip", timeout=300, chunk_size=65536, restart=False, checksum="", checksum_type="sha256", retries=3):
+    """Download data prepared with write_downloadable, by UUID. The file is polled for (with exponential backoff) until it is ready, then streamed to disk.
+
+When writing to a path, data is first written to ``<path>.part``, alongside a ``<path>.part.json`` journal. If the transfer is interrupted, it is resumed with an HTTP range request (when the server supports them), both within this call (up to ``retries`` times) and by a later call for the same UUID and path.
 
 Output:
 
-    a dictionary
+    the number of bytes written
     """
-    return ctx.gi.io.download(uuid, output_format=output_format)
+    return ctx.gi.io.download(uuid, path, output_format=output_format, timeout=timeout, chunk_size=chunk_size, restart=restart, checksum=checksum, checksum_type=checksum_type, retries=retries)
@@ -0,0 +1,57 @@
+import click
+from arrow.cli import pass_context
+from arrow.decorators import custom_exception, str_output
+
+
+@click.command('export')
+@click.argument("organism", type=str)
+@click.argument("path", type=str)
+@click.option(
+    "--export_type",
+    help="Export type. Choices: FASTA, GFF3",
+    default="FASTA",
+    show_default=True,
+    type=str
+)
+@click.option(
+    "--seq_type",
+    help="Export selection. Choices: peptide, cds, cdna, genomic",
+    default="peptide",
+    show_default=True,
+    type=str
+)
+@click.option(
+    "--export_format",
+    help="Export format, either gzip or text",
+    default="gzip",
+    show_default=True,
+    type=str
+)
+@click.option(
+    "--export_gff3_fasta",
+    help="Export reference sequence when exporting GFF3 annotations.",
+    is_flag=True
+)
+@click.option(
+    "--sequences",
+    help="Names of references sequences to add (default is all)",
+    type=str
+)
+@click.option(
+    "--timeout",
+    help="Maximum number of seconds to wait for the data to be ready",
+    default="300",
+    show_default=True,
+    type=float
+)
+@pass_context
+@custom_exception
+@str_output
+def cli(ctx, organism, path, export_type="FASTA", seq_type="peptide", export_format="gzip", export_gff3_fasta=False, sequences=None, timeout=300):
+    """Prepare a download for an organism on the server, then download it
+
+Output:
+
+    the number of bytes written
+    """
+    return ctx.gi.io.export(organism, path, export_type=export_type, seq_type=seq_type, export_format=export_format, export_gff3_fasta=export_gff3_fasta, sequences=sequences, timeout=timeout)
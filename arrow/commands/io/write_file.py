@@ -0,0 +1,62 @@
+import click
+from arrow.cli import pass_context
+from arrow.decorators import custom_exception, str_output
+
+
+@click.command('write_file')
+@click.argument("organism", type=str)
+@click.argument("path", type=str)
+@click.option(
+    "--export_type",
+    help="Export type. Choices: FASTA, GFF3",
+    default="FASTA",
+    show_default=True,
+    type=str
+)
+@click.option(
+    "--seq_type",
+    help="Export selection. Choices: peptide, cds, cdna, genomic",
+    default="peptide",
+    show_default=True,
+    type=str
+)
+@click.option(
+    "--export_format",
+    help="Export format, either gzip or text",
+    default="text",
+    show_default=True,
+    type=str
+)
+@click.option(
+    "--export_gff3_fasta",
+    help="Export reference sequence when exporting GFF3 annotations.",
+    is_flag=True
+)
+@click.option(
+    "--sequences",
+    help="Names of references sequences to add (default is all)",
+    type=str
+)
+@click.option(
+    "--keep_compressed",
+    help="Write gzip exports as sent by the server, rather than decompressing them",
+    is_flag=True
+)
+@click.option(
+    "--chunk_size",
+    help="Size of the chunks read from the server, in bytes",
+    default="65536",
+    show_default=True,
+    type=int
+)
+@pass_context
+@custom_exception
+@str_output
+def cli(ctx, organism, path, export_type="FASTA", seq_type="peptide", export_format="text", export_gff3_fasta=False, sequences=None, keep_compressed=False, chunk_size=65536):
+    """Stream an export for an organism straight to a file, without loading it in memory
+
+Output:
+
+    the number of bytes written
+    """
+    return ctx.gi.io.write_file(organism, path, export_type=export_type, seq_type=seq_type, export_format=export_format, export_gff3_fasta=export_gff3_fasta, sequences=sequences, keep_compressed=keep_compressed, chunk_size=chunk_size)
@@ -0,0 +1,63 @@
+import click
+from arrow.cli import pass_context
+from arrow.decorators import custom_exception, str_output
+
+
+@click.command('write_sharded')
+@click.argument("organism", type=str)
+@click.argument("path", type=str)
+@click.option(
+    "--export_type",
+    help="Export type. Choices: FASTA, GFF3",
+    default="GFF3",
+    show_default=True,
+    type=str
+)
+@click.option(
+    "--seq_type",
+    help="Export selection. Choices: peptide, cds, cdna, genomic",
+    default="genomic",
+    show_default=True,
+    type=str
+)
+@click.option(
+    "--export_format",
+    help="Transfer format of each shard, either gzip or text. The output file is always uncompressed.",
+    default="text",
+    show_default=True,
+    type=str
+)
+@click.option(
+    "--export_gff3_fasta",
+    help="Export reference sequence when exporting GFF3 annotations.",
+    is_flag=True
+)
+@click.option(
+    "--sequences",
+    help="Names of references sequences to export (default is all)",
+    type=str,
+    multiple=True
+)
+@click.option(
+    "--shards",
+    help="Number of shards (default: twice the number of workers)",
+    type=int
+)
+@click.option(
+    "--workers",
+    help="Number of concurrent exports",
+    default="4",
+    show_default=True,
+    type=int
+)
+@pass_context
+@custom_exception
+@str_output
+def cli(ctx, organism, path, export_type="GFF3", seq_type="genomic", export_format="text", export_gff3_fasta=False, sequences=None, shards=None, workers=4):
+    """Export data for an organism as shards of its sequences exported concurrently, then combined into a single file in sequence order
+
+Output:
+
+    the number of bytes written
+    """
+    return ctx.gi.io.write_sharded(organism, path, export_type=export_type, seq_type=seq_type, export_format=export_format, export_gff3_fasta=export_gff3_fasta, sequences=sequences, shards=shards, workers=workers)
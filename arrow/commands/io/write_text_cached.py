@@ -0,0 +1,62 @@
+import click
+from arrow.cli import pass_context
+from arrow.decorators import custom_exception, str_output
+
+
+@click.command('write_text_cached')
+@click.argument("organism", type=str)
+@click.argument("cache_dir", type=str)
+@click.option(
+    "--export_type",
+    help="Export type. Choices: FASTA, GFF3",
+    default="FASTA",
+    show_default=True,
+    type=str
+)
+@click.option(
+    "--seq_type",
+    help="Export selection. Choices: peptide, cds, cdna, genomic",
+    default="peptide",
+    show_default=True,
+    type=str
+)
+@click.option(
+    "--export_gff3_fasta",
+    help="Export reference sequence when exporting GFF3 annotations.",
+    is_flag=True
+)
+@click.option(
+    "--sequences",
+    help="Names of references sequences to add (default is all)",
+    type=str
+)
+@click.option(
+    "--max_cache_size",
+    help="Maximum size of the cache directory, in bytes",
+    default="1073741824",
+    show_default=True,
+    type=int
+)
+@click.option(
+    "--marker",
+    help="Value changing whenever the organism's annotations do. By default, a digest of the identifier and modification time of every feature of the exported sequences is fetched.",
+    type=str
+)
+@click.option(
+    "--marker_ttl",
+    help="Number of seconds the default marker is reused for, 0 to fetch it on every call",
+    default="60",
+    show_default=True,
+    type=float
+)
+@pass_context
+@custom_exception
+@str_output
+def cli(ctx, organism, cache_dir, export_type="FASTA", seq_type="peptide", export_gff3_fasta=False, sequences=None, max_cache_size=1073741824, marker=None, marker_ttl=60):
+    """Same as write_text, but served from an on-disk cache when the organism's annotations did not change since the cached export
+
+Output:
+
+    the exported data
+    """
+    return ctx.gi.io.write_text_cached(organism, cache_dir, export_type=export_type, seq_type=seq_type, export_gff3_fasta=export_gff3_fasta, sequences=sequences, max_cache_size=max_cache_size, marker=marker, marker_ttl=marker_ttl)
@@ -1,6 +1,5 @@
 from __future__ import absolute_import
 import os
-import yaml
 
 DEFAULT_CONFIG = {
 }
@@ -20,5 +19,6 @@ def read_global_config():
     if not os.path.exists(config_path):
         return DEFAULT_CONFIG
 
+    import yaml
     with open(config_path) as f:
-        return yaml.load(f)
+        return yaml.safe_load(f)
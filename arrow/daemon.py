@@ -0,0 +1,323 @@
+"""
+Resident arrow server, running commands sent over a Unix domain socket.
+
+The server keeps the configuration, the Apollo instances (with their
+connection pools) and the module level caches of the apollo library alive
+between commands, so an ``arrow`` call forwarded to it only pays for a
+socket round trip. Each connection carries a single JSON request line and
+gets a single JSON response line back.
+"""
+from __future__ import absolute_import
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# Commands which are interactive, read stdin or manage the daemon itself,
+# and are therefore always run in process.
+LOCAL_COMMANDS = ('batch', 'daemon', 'init')
+
+# Environment variables which do not change what a forwarded command does
+_LOCAL_ENV = ('ARROW_NO_DAEMON', 'ARROW_DAEMON_SOCKET')
+
+
+def socket_path():
+    """Path of the daemon's socket, ``$ARROW_DAEMON_SOCKET`` or ~/.apollo-arrow.sock"""
+    return os.path.expanduser(os.environ.get('ARROW_DAEMON_SOCKET', '~/.apollo-arrow.sock'))
+
+
+def _arrow_env():
+    return dict((k, v) for k, v in os.environ.items()
+                if k.startswith('ARROW_') and k not in _LOCAL_ENV)
+
+
+def _command_name(argv):
+    """First argument which is not a global option of arrow"""
+    args = iter(argv)
+    for arg in args:
+        if arg in ('-a', '--apollo_instance', '-o', '--output'):
+            next(args, None)
+        elif not arg.startswith('-'):
+            return arg
+    return None
+
+
+def _forwardable(argv):
+    return _command_name(argv) not in LOCAL_COMMANDS and '-' not in argv
+
+
+def request(path, message, connect_timeout=1.0):
+    """
+    Send a request to the daemon
+
+    :rtype: dict
+    :return: the response, or None if the daemon could not be reached
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(connect_timeout)
+        try:
+            client.connect(path)
+            client.sendall(json.dumps(message).encode('utf-8') + b'\n')
+            client.shutdown(socket.SHUT_WR)
+        except (socket.error, OSError):
+            # Not listening (or shutting down): the request was not read
+            return None
+        # Commands may take a while to run
+        client.settimeout(None)
+        chunks = []
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        client.close()
+    if not chunks:
+        raise Exception("The arrow daemon closed the connection without answering")
+    return json.loads(b''.join(chunks).decode('utf-8'))
+
+
+def forward(argv, path):
+    """
+    Run a command in the daemon, writing its output to this process' stdout
+    and stderr
+
+    :rtype: int
+    :return: the command's exit code, or None if it should be run in process
+      (daemon not running, command not forwardable or different environment)
+    """
+    if not _forwardable(argv):
+        return None
+
+    message = {
+        'op': 'run',
+        'argv': argv,
+        'cwd': os.getcwd(),
+        'env': _arrow_env(),
+    }
+    try:
+        response = request(path, message)
+    except Exception as e:
+        # The command may have run, running it again could repeat an edit
+        sys.stderr.write("Lost connection to the arrow daemon: %s\n" % e)
+        return 1
+    if response is None or response.get('fallback'):
+        return None
+
+    sys.stdout.write(response['stdout'])
+    sys.stdout.flush()
+    sys.stderr.write(response['stderr'])
+    sys.stderr.flush()
+    return response['exit_code']
+
+
+class _ThreadLocalStream(object):
+    """Standard stream redirected to a per-thread buffer while a command runs"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def redirect(self, buf):
+        self._local.buf = buf
+
+    def _target(self):
+        return getattr(self._local, 'buf', None) or self._stream
+
+    def write(self, data):
+        return self._target().write(data)
+
+    def flush(self):
+        return self._target().flush()
+
+    def isatty(self):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
+class _WorkingDirectory(object):
+    """
+    Run commands from the client's working directory. The working directory
+    is process wide, so commands from different directories take turns while
+    commands from the same directory run concurrently.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._cwd = None
+        self._active = 0
+
+    def enter(self, cwd):
+        with self._cond:
+            while self._active and self._cwd != cwd:
+                self._cond.wait()
+            if self._cwd != cwd:
+                os.chdir(cwd)
+                self._cwd = cwd
+            self._active += 1
+
+    def exit(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline().decode('utf-8'))
+            response = self.server.dispatch(message)
+        except Exception:
+            response = {'exit_code': 1, 'stdout': '', 'stderr': traceback.format_exc()}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+class ArrowDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Server running arrow commands in a long lived process
+
+    :type path: str
+    :param path: Path of the Unix domain socket to listen on
+    """
+    daemon_threads = True
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            if request(path, {'op': 'status'}) is not None:
+                raise Exception("An arrow daemon is already listening on %s" % path)
+            # Left behind by a daemon which did not shut down cleanly
+            os.unlink(path)
+
+        # The daemon holds Apollo credentials, only its user may connect
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        finally:
+            os.umask(umask)
+
+        self.path = path
+        self.started = time.time()
+        self.requests = 0
+        self.env = _arrow_env()
+        self._instances = {}
+        self._lock = threading.Lock()
+        self._cwd = _WorkingDirectory()
+        self._unlinked = False
+
+    def _unlink(self):
+        with self._lock:
+            if not self._unlinked:
+                self._unlinked = True
+                os.unlink(self.path)
+
+    def instance(self, instance_name):
+        """Apollo instance of that name, reloaded when the configuration changes"""
+        from .apollo import get_apollo_instance
+        from .config import global_config_path
+
+        try:
+            mtime = os.path.getmtime(global_config_path())
+        except OSError:
+            mtime = None
+        with self._lock:
+            cached = self._instances.get(instance_name)
+            if cached is None or cached[0] != mtime:
+                if cached is not None:
+                    cached[1].close()
+                cached = (mtime, get_apollo_instance(instance_name))
+                self._instances[instance_name] = cached
+            return cached[1]
+
+    def dispatch(self, message):
+        op = message.get('op')
+        if op == 'status':
+            return {
+                'pid': os.getpid(),
+                'socket': self.path,
+                'started': self.started,
+                'requests': self.requests,
+                'instances': sorted(str(x) for x in self._instances),
+            }
+        elif op == 'stop':
+            # New clients fall back to running commands in process right away
+            self._unlink()
+            threading.Thread(target=self.shutdown).start()
+            return {'pid': os.getpid()}
+        elif op == 'run':
+            if message.get('env', {}) != self.env:
+                # Options or configuration set through the environment
+                return {'fallback': True}
+            with self._lock:
+                self.requests += 1
+            self._cwd.enter(message['cwd'])
+            try:
+                return self.run(message['argv'])
+            finally:
+                self._cwd.exit()
+        raise Exception("Unknown request %r" % op)
+
+    def run(self, argv):
+        """Run an arrow command, capturing its output"""
+        from .cli import arrow, Context
+
+        server = self
+
+        class DaemonContext(Context):
+
+            def _connect(self, instance_name):
+                return server.instance(instance_name)
+
+        stdout, stderr = StringIO(), StringIO()
+        sys.stdout.redirect(stdout)
+        sys.stderr.redirect(stderr)
+        try:
+            arrow.main(args=argv, prog_name='arrow', obj=DaemonContext())
+            exit_code = 0
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            if not isinstance(e.code, int) and e.code is not None:
+                stderr.write('%s\n' % e.code)
+        except Exception:
+            stderr.write(traceback.format_exc())
+            exit_code = 1
+        finally:
+            sys.stdout.redirect(None)
+            sys.stderr.redirect(None)
+        return {
+            'exit_code': exit_code,
+            'stdout': stdout.getvalue(),
+            'stderr': stderr.getvalue(),
+        }
+
+    def serve(self):
+        """Serve requests until stopped, removing the socket afterwards"""
+        sys.stdout = _ThreadLocalStream(sys.stdout)
+        sys.stderr = _ThreadLocalStream(sys.stderr)
+        try:
+            self.serve_forever()
+        finally:
+            self.server_close()
+            self._unlink()
+            for _, instance in self._instances.values():
+                instance.close()
+
+
+if __name__ == '__main__':
+    ArrowDaemon(sys.argv[1] if len(sys.argv) > 1 else socket_path()).serve()
@@ -15,8 +15,10 @@ def custom_exception(wrapped, instance, args, kwargs):
         if hasattr(e, 'body'):
             try:
                 error(json.loads(e.body)['err_msg'])
-            except json.decoder.JSONDecodeError:
+            except (ValueError, KeyError, TypeError):
                 error(str(e))
+            ctx = args[0]
+            ctx.exit(1)
         else:
             exc_type, exc_value, exc_traceback = sys.exc_info()
             lines = traceback.format_exception(exc_type, exc_value, exc_traceback)
@@ -26,16 +28,37 @@ def custom_exception(wrapped, instance, args, kwargs):
             ctx.exit(1)
 
 
+def _json_output(ctx, output):
+    """Write a command's result in the output format chosen with ``arrow -o``"""
+    output_format = getattr(ctx, 'output_format', 'pretty')
+    out = sys.stdout
+    if output_format == 'ndjson' and isinstance(output, dict) and list(output) == ['features'] \
+            and isinstance(output['features'], list):
+        # A standard apollo feature dictionary, one feature per line
+        output = output['features']
+    if output_format == 'ndjson' and isinstance(output, (list, tuple)):
+        # One element at a time, so consumers can start right away
+        for item in output:
+            out.write(json.dumps(item, separators=(',', ':')))
+            out.write('\n')
+    elif output_format in ('compact', 'ndjson'):
+        out.write(json.dumps(output, separators=(',', ':')))
+        out.write('\n')
+    else:
+        json.dump(output, out, indent=4)
+        out.write('\n')
+
+
 @wrapt.decorator
 def list_output(wrapped, instance, args, kwargs):
     output = wrapped(*args, **kwargs)
-    print((json.dumps(output, indent=4)))
+    _json_output(args[0], output)
 
 
 @wrapt.decorator
 def dict_output(wrapped, instance, args, kwargs):
     output = wrapped(*args, **kwargs)
-    print((json.dumps(output, indent=4)))
+    _json_output(args[0], output)
 
 
 @wrapt.decorator
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Measure how long arrow takes to start and run a single command, and check
+that it does not import the modules arrow should only load on demand.
+
+    python benchmarks/startup_benchmark.py [--runs 20] [--max-ms 250]
+
+Two commands are timed: ``--help``, which never connects to Apollo, and a
+real ``annotations set_name`` sent to a local stub of the Apollo server.
+The second one has to import ``requests``, which is timed on its own for
+comparison: it is most of what remains of the startup time.
+"""
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+HELP_COMMAND = ['annotations', 'set_name', '--help']
+# Modules which are only needed once a command talks to Apollo
+HELP_DEFERRED = ['apollo', 'requests', 'yaml', 'Bio', 'cachetools']
+
+COMMAND = ['annotations', 'set_name', 'feature', 'name', '--organism', 'org', '--sequence', 'seq']
+# Modules which this command does not need (concurrent.futures is not
+# checked, recent versions of wrapt import it through asyncio)
+COMMAND_DEFERRED = ['Bio', 'cachetools', 'sqlite3', 'apollo.io',
+                    'apollo.organisms', 'apollo.users', 'apollo.response_cache',
+                    'arrow.commands.io']
+
+RUN = """
+import sys
+sys.argv = ['arrow'] + %r
+from arrow.cli import arrow
+try:
+    arrow()
+except SystemExit as e:
+    if e.code:
+        raise
+loaded = sorted(m for m in %r if m in sys.modules)
+sys.stderr.write('\\n' + ','.join(loaded))
+"""
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers every request with an empty feature dictionary"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        body = b'{"features": []}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run_once(code, env=None):
+    start = time.time()
+    proc = subprocess.Popen([sys.executable, '-c', code], env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = proc.communicate()
+    elapsed = (time.time() - start) * 1000
+    if proc.returncode != 0:
+        raise Exception("Benchmark run failed: %s" % err.decode('utf-8'))
+    return elapsed, err.decode('utf-8')
+
+
+def measure(label, code, runs, env=None):
+    timings = []
+    output = ''
+    for _ in range(runs):
+        elapsed, output = run_once(code, env=env)
+        timings.append(elapsed)
+    timings.sort()
+    median = timings[len(timings) // 2]
+    print("%s: median %.1fms, min %.1fms, max %.1fms over %d runs" % (
+        label, median, timings[0], timings[-1], runs))
+    return median, output
+
+
+def measure_command(command, deferred, runs, env=None):
+    median, output = measure('arrow %s' % ' '.join(command),
+                             RUN % (command, deferred), runs, env=env)
+    loaded = output.strip().splitlines()
+    loaded = loaded[-1].split(',') if loaded and loaded[-1] else []
+    if loaded:
+        print("  imported, should be deferred: %s" % ', '.join(loaded))
+    return median, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--runs', type=int, default=20, help='Number of runs')
+    parser.add_argument('--max-ms', type=float, help='Fail if the median run of a command takes longer')
+    args = parser.parse_args()
+
+    server = HTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    directory = tempfile.mkdtemp()
+    try:
+        config = os.path.join(directory, 'arrow.yml')
+        with open(config, 'w') as handle:
+            handle.write('__default: stub\nstub:\n  url: "http://127.0.0.1:%d"\n'
+                         '  username: user\n  password: password\n' % server.server_address[1])
+        env = dict(os.environ, ARROW_GLOBAL_CONFIG_PATH=config)
+
+        help_median, help_loaded = measure_command(HELP_COMMAND, HELP_DEFERRED, args.runs, env=env)
+        median, loaded = measure_command(COMMAND, COMMAND_DEFERRED, args.runs, env=env)
+        measure('python -c "import requests"', 'import requests', args.runs)
+        measure('python -c "pass"', 'pass', args.runs)
+    finally:
+        server.shutdown()
+        shutil.rmtree(directory)
+
+    failed = bool(help_loaded or loaded)
+    if args.max_ms is not None and max(help_median, median) > args.max_ms:
+        print("Median run time above %.1fms" % args.max_ms)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
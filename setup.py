@@ -22,9 +22,14 @@ setup(
     packages=['apollo', 'arrow'] + subpackages,
     entry_points='''
         [console_scripts]
-        arrow=arrow.cli:arrow
+        arrow=arrow.cli:main
     ''',
-    install_requires=['requests', 'biopython', 'cachetools', 'click>=6.7', 'wrapt', 'pyyaml'],
+    install_requires=['requests', 'biopython', 'cachetools', 'click>=6.7', 'wrapt', 'pyyaml',
+                      'futures; python_version < "3"'],
+    extras_require={
+        'async': ['aiohttp; python_version >= "3.6"'],
+        'gff3': ['bcbio-gff'],
+    },
     license="MIT",
     classifiers=[
         "Development Status :: 4 - Beta",
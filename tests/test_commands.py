@@ -0,0 +1,30 @@
+import os
+import unittest
+
+from arrow.cli import ArrowCLI, cmd_folder, group_subcmds, list_subcmds, name_to_command
+
+
+class GroupCommandsTest(unittest.TestCase):
+
+    def test_match_command_packages(self):
+        packages = sorted(
+            name for name in os.listdir(cmd_folder)
+            if os.path.isdir(os.path.join(cmd_folder, name)) and not name.startswith('__')
+        )
+        for group in packages:
+            self.assertEqual(sorted(group_subcmds(group)), list_subcmds(group), group)
+
+    def test_match_generated_groups(self):
+        # The lazy groups resolve the same commands as the generated ones
+        for group in ('annotations', 'io', 'status'):
+            generated = name_to_command(None, group)
+            lazy = ArrowCLI().get_command(None, group)
+            self.assertEqual(lazy.list_commands(None), sorted(generated.commands), group)
+
+    def test_not_a_group(self):
+        self.assertEqual(group_subcmds('batch'), [])
+        self.assertEqual(group_subcmds('nonexistent'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
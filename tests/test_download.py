@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from apollo import ApolloInstance
+
+DATA = b''.join(b'>seq%d\nACGTACGTACGT\n' % i for i in range(500))
+ETAG = '"v1"'
+
+
+class DownloadHandler(BaseHTTPRequestHandler):
+    """Serves DATA on /IOService/download, honouring range requests"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.ranges.append(self.headers.get('Range'))
+
+        requested = self.headers.get('Range')
+        if requested and self.headers.get('If-Range') not in (None, ETAG):
+            # Changed since the partial download, send the whole file
+            requested = None
+
+        if requested:
+            start = int(requested[len('bytes='):].rstrip('-'))
+            if start >= len(DATA):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */%d' % len(DATA))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = DATA[start:]
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(DATA) - 1, len(DATA)))
+        else:
+            body = DATA
+            self.send_response(200)
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), DownloadHandler)
+        self.server.ranges = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.wa = ApolloInstance('http://127.0.0.1:%d' % self.server.server_address[1],
+                                 'user', 'password', retry=False)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'export.fa')
+
+    def tearDown(self):
+        self.wa.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def partial(self, data, validator=ETAG):
+        """Leave an interrupted download of ``data`` behind"""
+        with open(self.path + '.part', 'wb') as handle:
+            handle.write(data)
+        with open(self.path + '.part.json', 'w') as handle:
+            json.dump({'uuid': 'uuid', 'format': 'text', 'validator': validator}, handle)
+
+    def assertDownloaded(self, size):
+        self.assertEqual(size, len(DATA))
+        with open(self.path, 'rb') as handle:
+            self.assertEqual(handle.read(), DATA)
+        self.assertEqual(os.listdir(self.directory), ['export.fa'])
+
+    def download(self, **kwargs):
+        return self.wa.io.download('uuid', self.path, output_format='text', **kwargs)
+
+    def test_download(self):
+        self.assertDownloaded(self.download())
+        self.assertEqual(self.server.ranges, [None])
+
+    def test_resume(self):
+        self.partial(DATA[:1000])
+        self.assertDownloaded(self.download())
+        self.assertEqual(self.server.ranges, ['bytes=1000-'])
+
+    def test_resume_changed_file(self):
+        self.partial(b'stale data', validator='"v0"')
+        self.assertDownloaded(self.download())
+        self.assertEqual(self.server.ranges, ['bytes=10-'])
+
+    def test_restart(self):
+        self.partial(DATA[:1000])
+        self.assertDownloaded(self.download(restart=True))
+        self.assertEqual(self.server.ranges, [None])
+
+    def test_complete_part_verified(self):
+        # 416: the whole file was downloaded but not renamed
+        self.partial(DATA)
+        checksum = hashlib.sha256(DATA).hexdigest()
+        self.assertDownloaded(self.download(checksum=checksum))
+        self.assertEqual(self.server.ranges, ['bytes=%d-' % len(DATA)])
+
+    def test_complete_part_unverified(self):
+        # Without a checksum to trust it, a 416 part is downloaded again
+        self.partial(DATA + b'garbage')
+        self.assertDownloaded(self.download())
+        self.assertEqual(self.server.ranges, ['bytes=%d-' % (len(DATA) + 7), None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import threading
+import time
+import unittest
+
+from apollo.annotations import AnnotationEditBuffer
+
+
+class FakeClient(object):
+    BATCH_SIZE = 100
+
+    def __init__(self):
+        self.calls = []
+        # Operations failing while in this set
+        self.failing = set()
+        self.posted = threading.Event()
+
+    def _post_batched(self, operation, features, organism=None, sequence=None, batch_size=None):
+        if operation in self.failing:
+            raise Exception("%s failed" % operation)
+        self.calls.append((operation, features))
+        self.posted.set()
+        return {'features': features}
+
+
+class AnnotationEditBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeClient()
+        self.buffer = AnnotationEditBuffer(self.client, organism='o', sequence='s')
+
+    def test_newer_property_replaces_pending_one(self):
+        self.buffer.set_name('f1', 'first')
+        self.buffer.set_status('f1', 'Finished')
+        self.buffer.set_name('f1', 'second')
+        self.assertEqual(len(self.buffer), 2)
+        self.assertEqual(self.buffer.coalesced, 1)
+
+        self.buffer.flush()
+        self.assertEqual(self.client.calls, [
+            ('setName', [{'uniquename': 'f1', 'name': 'second'}]),
+            ('setStatus', [{'uniquename': 'f1', 'status': 'Finished'}]),
+        ])
+
+    def test_delete_attribute_cancels_pending_addition(self):
+        self.buffer.add_attribute('f1', 'note', 'x')
+        self.buffer.delete_attribute('f1', 'note', 'x')
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.buffer.coalesced, 2)
+
+        self.buffer.flush()
+        self.assertEqual(self.client.calls, [])
+
+    def test_delete_feature_discards_pending_edits(self):
+        self.buffer.set_name('f1', 'name')
+        self.buffer.add_attribute('f1', 'note', 'x')
+        self.buffer.set_name('f2', 'other')
+        self.buffer.delete_feature('f1')
+        self.buffer.set_symbol('f1', 'ignored')
+
+        self.buffer.flush()
+        self.assertEqual(self.client.calls, [
+            ('setName', [{'uniquename': 'f2', 'name': 'other'}]),
+            ('deleteFeature', [{'uniquename': 'f1'}]),
+        ])
+
+    def test_failed_batch_stays_queued(self):
+        self.buffer.set_name('f1', 'name')
+        self.buffer.add_attribute('f1', 'note', 'x')
+        self.client.failing.add('addAttribute')
+
+        self.assertRaises(Exception, self.buffer.flush)
+        # The names were applied, the attribute is still pending
+        self.assertEqual([c[0] for c in self.client.calls], ['setName'])
+        self.assertEqual(len(self.buffer), 1)
+
+        self.client.failing.clear()
+        self.buffer.flush()
+        self.assertEqual([c[0] for c in self.client.calls], ['setName', 'addAttribute'])
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_max_age_flushes_without_new_edits(self):
+        buffer = AnnotationEditBuffer(self.client, organism='o', sequence='s', max_age=0.05)
+        buffer.set_name('f1', 'name')
+        self.assertTrue(self.client.posted.wait(5))
+        self.assertEqual(len(buffer), 0)
+
+    def test_max_age_timer_cancelled_on_exit(self):
+        with AnnotationEditBuffer(self.client, organism='o', sequence='s', max_age=0.05) as buffer:
+            buffer.set_name('f1', 'name')
+        self.assertEqual(len(self.client.calls), 1)
+        self.assertIsNone(buffer._timer)
+        time.sleep(0.1)
+        self.assertEqual(len(self.client.calls), 1)
+
+    def test_max_age_flush_error_is_kept(self):
+        self.client.failing.add('setName')
+        buffer = AnnotationEditBuffer(self.client, organism='o', sequence='s', max_age=0.05)
+        buffer.set_name('f1', 'name')
+        deadline = time.time() + 5
+        while buffer.last_error is None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertIsNotNone(buffer.last_error)
+        self.assertEqual(len(buffer), 1)
+
+        # Retried by the re-armed timer
+        self.client.failing.clear()
+        self.assertTrue(self.client.posted.wait(5))
+        buffer.flush()
+        self.assertEqual(len(buffer), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from apollo.annotations import _gff3_chunks
+
+
+def _line(seqid, ftype, start, end, attributes):
+    return '%s\t.\t%s\t%d\t%d\t.\t+\t.\t%s\n' % (seqid, ftype, start, end, attributes)
+
+
+# Coordinate sorted genes overlapping each other, so that the parts of g1
+# come after the start of g2
+INTERLEAVED = [
+    '##gff-version 3\n',
+    _line('chr1', 'gene', 1, 500, 'ID=g1'),
+    _line('chr1', 'mRNA', 1, 500, 'ID=m1;Parent=g1'),
+    _line('chr1', 'exon', 1, 100, 'ID=e1;Parent=m1'),
+    _line('chr1', 'gene', 200, 900, 'ID=g2'),
+    _line('chr1', 'mRNA', 200, 900, 'ID=m2;Parent=g2'),
+    _line('chr1', 'exon', 200, 300, 'Parent=m2'),
+    _line('chr1', 'exon', 400, 500, 'ID=e3;Parent=m1'),
+    _line('chr1', 'gene', 1000, 1100, 'ID=g3'),
+    _line('chr1', 'mRNA', 1000, 1100, 'ID=m3;Parent=g3'),
+    _line('chr2', 'gene', 1, 100, 'ID=g4'),
+]
+
+
+def _chunks(lines, target_lines):
+    return [chunk.splitlines(True) for chunk in _gff3_chunks(StringIO(''.join(lines)), target_lines)]
+
+
+def _chunk_of(chunks, text):
+    return [i for i, chunk in enumerate(chunks) if any(text in line for line in chunk)]
+
+
+class Gff3ChunksTest(unittest.TestCase):
+
+    def test_lines_kept_in_order(self):
+        for target_lines in (1, 2, 5, 100):
+            chunks = _chunks(INTERLEAVED, target_lines)
+            self.assertEqual(sum(chunks, []), INTERLEAVED)
+
+    def test_interleaved_hierarchies_stay_together(self):
+        chunks = _chunks(INTERLEAVED, 1)
+        # g1 continues after g2 started, so both are in the same chunk
+        self.assertEqual(_chunk_of(chunks, 'ID=g1'), _chunk_of(chunks, 'ID=e3;Parent=m1'))
+        self.assertEqual(_chunk_of(chunks, 'ID=g1'), _chunk_of(chunks, 'ID=g2'))
+        # Then each gene starts a chunk of its own
+        self.assertEqual(_chunk_of(chunks, 'ID=g3'), _chunk_of(chunks, 'ID=m3;Parent=g3'))
+        self.assertNotEqual(_chunk_of(chunks, 'ID=g3'), _chunk_of(chunks, 'ID=g2'))
+        self.assertNotEqual(_chunk_of(chunks, 'ID=g4'), _chunk_of(chunks, 'ID=g3'))
+        self.assertEqual(len(chunks), 3)
+
+    def test_children_before_parents(self):
+        lines = [
+            _line('chr1', 'exon', 1, 100, 'Parent=m1'),
+            _line('chr1', 'gene', 500, 600, 'ID=g9'),
+            _line('chr1', 'mRNA', 1, 100, 'ID=m1;Parent=g1'),
+            _line('chr1', 'gene', 1, 100, 'ID=g1'),
+            _line('chr1', 'gene', 700, 800, 'ID=g2'),
+        ]
+        chunks = _chunks(lines, 1)
+        self.assertEqual(chunks, [lines[:4], lines[4:]])
+
+    def test_multiple_parents_link_hierarchies(self):
+        lines = [
+            _line('chr1', 'mRNA', 1, 100, 'ID=m1'),
+            _line('chr1', 'mRNA', 1, 100, 'ID=m2'),
+            _line('chr1', 'exon', 1, 50, 'Parent=m1,m2'),
+            _line('chr1', 'mRNA', 200, 300, 'ID=m3'),
+        ]
+        self.assertEqual(_chunks(lines, 1), [lines[:3], lines[3:]])
+
+    def test_fasta_section_skipped(self):
+        lines = [_line('chr1', 'gene', 1, 100, 'ID=g1'), '##FASTA\n', '>chr1\n', 'ACGT\n']
+        self.assertEqual(_chunks(lines, 1), [lines[:1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
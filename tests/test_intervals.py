@@ -0,0 +1,133 @@
+import random
+import threading
+import unittest
+
+from apollo.intervals import FeatureIndex
+
+
+def _feature(uniquename, fmin, fmax, strand=1):
+    return {
+        'uniquename': uniquename,
+        'sequence': 's',
+        'location': {'fmin': fmin, 'fmax': fmax, 'strand': strand},
+    }
+
+
+def _brute_overlapping(features, start, end):
+    return sorted(
+        f['uniquename'] for f in features
+        if f['location']['fmin'] < end and start < f['location']['fmax']
+    )
+
+
+class FeatureIndexTest(unittest.TestCase):
+
+    def test_overlapping_incomplete_subtree(self):
+        coords = [
+            (383, 405), (326, 343), (314, 319), (100, 172), (413, 462), (253, 329),
+            (232, 273), (67, 73), (266, 353), (472, 479), (109, 186), (36, 115),
+            (178, 222), (225, 320), (420, 514), (393, 453), (106, 107), (256, 318),
+            (53, 148), (485, 593), (169, 196), (376, 432), (398, 471), (236, 247),
+            (135, 211), (143, 200), (174, 193), (333, 369), (349, 460), (361, 414),
+            (496, 526), (10, 63), (27, 119), (451, 525), (460, 491), (19, 64),
+            (143, 225), (263, 266), (318, 340), (386, 498), (95, 204), (286, 377),
+            (349, 392),
+        ]
+        index = FeatureIndex([_feature(str(i), a, b) for i, (a, b) in enumerate(coords)])
+        hits = index.overlapping('s', 580, 642)
+        self.assertEqual([(f['location']['fmin'], f['location']['fmax']) for f in hits], [(485, 593)])
+
+    def test_random_queries_match_brute_force(self):
+        rng = random.Random(42)
+        for trial in range(200):
+            features = []
+            for i in range(rng.randint(0, 80)):
+                fmin = rng.randint(0, 600)
+                fmax = fmin + rng.randint(1, rng.choice([10, 50, 200]))
+                features.append(_feature('f%d' % i, fmin, fmax, strand=rng.choice([1, -1])))
+            index = FeatureIndex(features)
+
+            # Edits after the index was queried must be picked up
+            if features and trial % 2:
+                index.overlapping('s', 0, 1)
+                removed = features.pop(rng.randrange(len(features)))
+                index.remove(removed['uniquename'])
+
+            for _ in range(50):
+                start = rng.randint(-20, 820)
+                end = start + rng.randint(1, 150)
+                expected = _brute_overlapping(features, start, end)
+                hits = index.overlapping('s', start, end)
+                self.assertEqual(sorted(f['uniquename'] for f in hits), expected)
+
+                contained = [f['uniquename'] for f in index.contained('s', start, end)]
+                self.assertEqual(sorted(contained), sorted(
+                    f['uniquename'] for f in features
+                    if f['location']['fmin'] >= start and f['location']['fmax'] <= end))
+
+                containing = [f['uniquename'] for f in index.containing('s', start, end)]
+                self.assertEqual(sorted(containing), sorted(
+                    f['uniquename'] for f in features
+                    if f['location']['fmin'] <= start and f['location']['fmax'] >= end))
+
+    def test_long_feature_does_not_hide_later_ones(self):
+        features = [_feature('long', 0, 10 ** 6)]
+        features.extend(_feature('g%d' % i, i * 100, i * 100 + 50) for i in range(1, 2000))
+        index = FeatureIndex(features)
+        hits = index.overlapping('s', 150020, 150030)
+        self.assertEqual([f['uniquename'] for f in hits], ['long', 'g1500'])
+
+    def test_incremental_edits_match_brute_force(self):
+        rng = random.Random(7)
+        features = {}
+        index = FeatureIndex()
+        for step in range(2000):
+            name = 'f%d' % rng.randint(0, 300)
+            if name in features and rng.random() < 0.3:
+                del features[name]
+                index.remove(name)
+            elif name in features and rng.random() < 0.3:
+                fmin = rng.randint(0, 5000)
+                fmax = fmin + rng.randint(1, 400)
+                index.set_location(name, fmin=fmin, fmax=fmax)
+                features[name] = _feature(name, fmin, fmax)
+            else:
+                fmin = rng.randint(0, 5000)
+                features[name] = _feature(name, fmin, fmin + rng.randint(1, 400))
+                index.add(dict(features[name]))
+            self.assertEqual(len(index), len(features))
+
+            start = rng.randint(0, 5400)
+            end = start + rng.randint(1, 300)
+            hits = index.overlapping('s', start, end)
+            self.assertEqual(sorted(f['uniquename'] for f in hits),
+                             _brute_overlapping(features.values(), start, end))
+
+    def test_concurrent_adds_are_kept(self):
+        index = FeatureIndex()
+
+        def work(worker):
+            for i in range(300):
+                index.add(_feature('w%d-%d' % (worker, i), i * 10, i * 10 + 25))
+                index.overlapping('s', i * 10, i * 10 + 5)
+                if i % 3 == 0:
+                    index.remove('w%d-%d' % (worker, i))
+
+        threads = [threading.Thread(target=work, args=(w,)) for w in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(index), 8 * 200)
+        self.assertEqual(len(index.overlapping('s', 0, 3000)), 8 * 200)
+
+    def test_nearest(self):
+        index = FeatureIndex([_feature('a', 10, 20), _feature('b', 40, 50)])
+        self.assertEqual(index.nearest('s', 15)['uniquename'], 'a')
+        self.assertEqual(index.nearest('s', 24)['uniquename'], 'a')
+        self.assertEqual(index.nearest('s', 36)['uniquename'], 'b')
+        self.assertIsNone(index.nearest('t', 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
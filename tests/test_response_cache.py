@@ -0,0 +1,37 @@
+import unittest
+
+from apollo.response_cache import ResponseCache
+
+
+class FakeInstance(object):
+    apollo_url = 'http://apollo'
+    username = 'user'
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResponseCache()
+        self.wa = FakeInstance()
+        self.calls = 0
+
+    def fetch(self, body):
+        def fn():
+            self.calls += 1
+            return body
+        return self.cache.fetch(self.wa, '/organism/', 'findAllOrganisms', 'POST{}', fn)
+
+    def test_caches_responses(self):
+        self.assertEqual(self.fetch('[{"commonName": "Yeast"}]'), '[{"commonName": "Yeast"}]')
+        self.assertEqual(self.fetch('[]'), '[{"commonName": "Yeast"}]')
+        self.assertEqual(self.calls, 1)
+
+    def test_does_not_cache_errors(self):
+        # Apollo reports errors in the body of 200 responses
+        self.assertEqual(self.fetch('{"error": "Not authorized"}'), '{"error": "Not authorized"}')
+        self.assertEqual(self.fetch('[{"commonName": "Yeast"}]'), '[{"commonName": "Yeast"}]')
+        self.assertEqual(self.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()